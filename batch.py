@@ -0,0 +1,177 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from os.path import dirname, abspath
+
+# Add the directory of the 'treat' folder to the system path
+sys.path.append(abspath(dirname(__file__)) + "/treat")
+
+from app import config
+from app.model import analyze_script
+from app.registry import get_model
+
+def read_directory(directory):
+    # One script per file, identified by its path relative to the directory
+    for root, _, files in sorted(os.walk(directory)):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            script_id = os.path.relpath(path, directory)
+            yield script_id, lambda path=path: open(path, encoding="utf-8", errors="replace").read()
+
+def failed_read(message):
+    # Reader for a record that could not be parsed, so it is reported as an
+    # error under its id instead of stopping the run
+    def read():
+        raise ValueError(message)
+    return read
+
+def read_jsonl(path, id_field, text_field):
+    # One script per line; lines without an id are identified by their line number
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield str(line_number), failed_read(f"Line {line_number} is not valid JSON: {e}")
+                continue
+            if not isinstance(record, dict):
+                yield str(line_number), failed_read(f"Line {line_number} is not a JSON object")
+                continue
+            script_id = str(record.get(id_field, line_number))
+            yield script_id, lambda text=record.get(text_field, ""): text
+
+def completed_ids(output, retry_errors):
+    # Ids already in the output file, so an interrupted run can resume. A
+    # line cut short by a crash is dropped from the file.
+    done = set()
+    if not os.path.exists(output):
+        return done
+
+    valid_bytes = 0
+    with open(output, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            valid_bytes += len(line)
+            if not (retry_errors and "error" in record):
+                done.add(record["id"])
+
+    if valid_bytes < os.path.getsize(output):
+        logging.warning(f"Dropping a partly written line at the end of {output}")
+        with open(output, "r+b") as f:
+            f.truncate(valid_bytes)
+    return done
+
+class ResultWriter:
+    # Appends one JSON line per script and flushes it to disk straight away,
+    # so the output file doubles as the checkpoint
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+def analyze(script_id, read):
+    # Never raises: a script that cannot be read or analyzed gets an error
+    # line, so resuming does not stop at the same record again
+    start = time.perf_counter()
+    try:
+        text = read()
+        if not isinstance(text, str):
+            raise TypeError(f"Script text must be a string, not {type(text).__name__}")
+        result = analyze_script(text)
+    except Exception as e:
+        logging.warning(f"Could not analyze {script_id}: {e}")
+        result = {"error": str(e)}
+    record = {"id": script_id, "seconds": round(time.perf_counter() - start, 3)}
+    if isinstance(result, dict):
+        record["error"] = result["error"]
+    else:
+        record["triggers"] = result
+    return record
+
+def run_batch(scripts, output, workers, retry_errors=False):
+    # Analyze every script not already in the output, keeping at most
+    # 2 * workers scripts in memory at once
+    done = completed_ids(output, retry_errors)
+    if done:
+        logging.info(f"Resuming: {len(done)} scripts already in {output}")
+
+    writer = ResultWriter(output)
+    finished = 0
+    failed = 0
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            for script_id, read in scripts:
+                if script_id in done:
+                    continue
+                done.add(script_id)
+                pending.add(executor.submit(analyze, script_id, read))
+                if len(pending) < workers * 2:
+                    continue
+                completed, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    record = future.result()
+                    writer.write(record)
+                    finished += 1
+                    failed += "error" in record
+
+            for future in pending:
+                record = future.result()
+                writer.write(record)
+                finished += 1
+                failed += "error" in record
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"Analyzed {finished} scripts ({failed} failed) in {elapsed:.1f}s into {output}")
+    return finished, failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a directory or JSONL file of scripts into a JSONL file of triggers")
+    parser.add_argument("input", help="Directory of script files, or a JSONL file with one script per line")
+    parser.add_argument("--output", required=True, help="JSONL file to append results to; rerunning skips scripts already in it")
+    parser.add_argument("--workers", type=int, default=2, help="Scripts analyzed concurrently, all sharing one loaded model")
+    parser.add_argument("--process-workers", type=int, default=config.PROCESS_WORKERS, help="Inference worker processes (see TREAT_PROCESS_WORKERS)")
+    parser.add_argument("--id-field", default="id", help="JSONL field holding the script id")
+    parser.add_argument("--text-field", default="text", help="JSONL field holding the script text")
+    parser.add_argument("--retry-errors", action="store_true", help="Analyze scripts whose earlier result was an error again")
+    args = parser.parse_args(argv)
+
+    config.PROCESS_WORKERS = args.process_workers
+    if args.workers > 1 and args.process_workers == 0:
+        # Let concurrent scripts share model batches
+        config.SCHEDULER_ENABLED = True
+
+    if os.path.isdir(args.input):
+        scripts = read_directory(args.input)
+    else:
+        scripts = read_jsonl(args.input, args.id_field, args.text_field)
+
+    # Load the model once, before any worker needs it
+    get_model()
+    finished, failed = run_batch(scripts, args.output, args.workers, args.retry_errors)
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
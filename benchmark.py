@@ -0,0 +1,456 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from os.path import dirname, abspath
+
+# Add the directory of the 'treat' folder to the system path
+sys.path.append(abspath(dirname(__file__)) + "/treat")
+
+from app import config
+from app import metrics
+from app.model import run_analysis, chunk_script, classify, trigger_categories
+from app.cascade import needs_escalation
+from app.fakes import KeywordModelHandle
+from app.prefilter import Prefilter
+from app.procpool import shutdown_process_pool
+from app.memory import memory_report
+from app.registry import get_model
+from app.backends import BACKENDS
+
+# Scripts bundled with the repository
+TEST_FILES_DIR = os.path.join(abspath(dirname(__file__)), "test_Files")
+
+# Expected triggers per model and script, recorded with `suite --update-golden`
+GOLDEN_PATH = os.path.join(abspath(dirname(__file__)), "benchmark_golden.json")
+
+def load_scripts(directory=TEST_FILES_DIR):
+    # Read every script in the directory, sorted by file name
+    scripts = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                scripts.append((name, f.read()))
+    return scripts
+
+def timed_analysis(script, **kwargs):
+    # Run the analysis and return its result together with the wall time
+    start = time.perf_counter()
+    analysis = run_analysis(script, **kwargs)
+    return analysis, time.perf_counter() - start
+
+def label_agreement(reference, candidate):
+    # Fraction of (chunk, category) answers that are the same in both analyses
+    total = 0
+    agreed = 0
+    for chunk_idx, labels in reference["chunk_labels"].items():
+        for category, label in labels.items():
+            total += 1
+            agreed += candidate["chunk_labels"].get(chunk_idx, {}).get(category) == label
+    return agreed / total if total else 1.0
+
+def compare_engines(args):
+    # Compare the shared-encoder engine against the per-category prompt,
+    # treating the per-category answers as the reference
+    report = {"scripts": [], "categories": list(trigger_categories)}
+    for name, script in load_scripts(args.directory):
+        reference, reference_time = timed_analysis(script, engine="per-category", decoding="score")
+        candidate, candidate_time = timed_analysis(script, engine="shared-encoder", decoding="score")
+        entry = {
+            "script": name,
+            "chunks": reference["chunks"],
+            "label_agreement": label_agreement(reference, candidate),
+            "triggers_match": sorted(reference["final_triggers"]) == sorted(candidate["final_triggers"]),
+            "per_category_triggers": reference["final_triggers"],
+            "shared_encoder_triggers": candidate["final_triggers"],
+            "per_category_seconds": reference_time,
+            "shared_encoder_seconds": candidate_time
+        }
+        report["scripts"].append(entry)
+        print(
+            f"{name}: agreement {entry['label_agreement']:.1%}, "
+            f"triggers match: {entry['triggers_match']}, "
+            f"{reference_time:.2f}s -> {candidate_time:.2f}s"
+        )
+
+    scripts = report["scripts"]
+    if scripts:
+        report["mean_label_agreement"] = sum(entry["label_agreement"] for entry in scripts) / len(scripts)
+        report["trigger_match_rate"] = sum(entry["triggers_match"] for entry in scripts) / len(scripts)
+        print(f"Mean agreement {report['mean_label_agreement']:.1%}, trigger sets match on {report['trigger_match_rate']:.0%} of scripts")
+    return report
+
+def check_backend_parity(args):
+    # Compare each backend with torch-fp32: answer agreement, trigger sets and speedup
+    scripts = load_scripts(args.directory)
+    reference_handle = get_model(backend="torch-fp32")
+    references = {name: timed_analysis(script, handle=reference_handle) for name, script in scripts}
+    reference_time = sum(elapsed for _, elapsed in references.values())
+    report = {"reference": "torch-fp32", "reference_seconds": reference_time, "backends": []}
+
+    for backend in args.backends:
+        try:
+            handle = get_model(backend=backend)
+        except Exception as e:
+            print(f"{backend}: unavailable ({e})")
+            report["backends"].append({"backend": backend, "error": str(e)})
+            continue
+
+        agreements = []
+        matches = 0
+        elapsed_total = 0.0
+        for name, script in scripts:
+            analysis, elapsed = timed_analysis(script, handle=handle)
+            reference = references[name][0]
+            agreements.append(label_agreement(reference, analysis))
+            matches += sorted(reference["final_triggers"]) == sorted(analysis["final_triggers"])
+            elapsed_total += elapsed
+
+        entry = {
+            "backend": backend,
+            "label_agreement": sum(agreements) / len(agreements),
+            "trigger_match_rate": matches / len(scripts),
+            "seconds": elapsed_total,
+            "speedup": reference_time / elapsed_total
+        }
+        report["backends"].append(entry)
+        print(
+            f"{backend}: agreement {entry['label_agreement']:.1%}, "
+            f"trigger sets match on {entry['trigger_match_rate']:.0%} of scripts, "
+            f"{entry['speedup']:.2f}x vs torch-fp32"
+        )
+    return report
+
+def triggers_from_labels(chunk_labels, keep=lambda chunk_idx, category: True):
+    # Recompute the final triggers from per-chunk answers, treating pairs
+    # that keep() rejects as NO (same scoring and threshold as run_analysis)
+    scores = {}
+    for chunk_idx, labels in chunk_labels.items():
+        for category, label in labels.items():
+            if keep(chunk_idx, category):
+                scores[category] = scores.get(category, 0) + {"YES": 1, "MAYBE": 0.5}.get(label, 0)
+    chunks = len(chunk_labels)
+    return sorted(trigger_categories[category]["mapped_name"] for category, score in scores.items() if chunks and score / chunks > 0.6)
+
+def measure_prefilter(args):
+    # Recall of the lexical prefilter against full-model answers, and how many
+    # model calls it saves per script
+    config.PREFILTER = False
+    prefilter = Prefilter(trigger_categories, args.min_matches)
+    handle = get_model()
+    report = {"min_matches": args.min_matches, "scripts": []}
+
+    for name, script in load_scripts(args.directory):
+        analysis = run_analysis(script, handle=handle)
+        chunks = chunk_script(script, handle.tokenizer)
+        decisions = {
+            (chunk_idx, category): prefilter.should_send(chunks[chunk_idx].text, category)
+            for chunk_idx, labels in analysis["chunk_labels"].items()
+            for category in labels
+        }
+
+        positives = [pair for pair, send in decisions.items() if analysis["chunk_labels"][pair[0]][pair[1]] != "NO"]
+        kept_positives = sum(1 for pair in positives if decisions[pair])
+        prefiltered_triggers = triggers_from_labels(analysis["chunk_labels"], lambda chunk_idx, category: decisions[(chunk_idx, category)])
+        entry = {
+            "script": name,
+            "pairs": len(decisions),
+            "model_calls_saved": sum(1 for send in decisions.values() if not send),
+            "positive_pairs": len(positives),
+            "recall": kept_positives / len(positives) if positives else 1.0,
+            "triggers": sorted(analysis["final_triggers"]),
+            "prefiltered_triggers": prefiltered_triggers
+        }
+        entry["triggers_match"] = entry["triggers"] == prefiltered_triggers
+        report["scripts"].append(entry)
+        print(
+            f"{name}: recall {entry['recall']:.1%} on {len(positives)} positive pairs, "
+            f"saves {entry['model_calls_saved']}/{entry['pairs']} model calls, "
+            f"triggers match: {entry['triggers_match']}"
+        )
+
+    scripts = report["scripts"]
+    positives = sum(entry["positive_pairs"] for entry in scripts)
+    if scripts:
+        report["recall"] = sum(entry["recall"] * entry["positive_pairs"] for entry in scripts) / positives if positives else 1.0
+        report["model_calls_saved_per_script"] = sum(entry["model_calls_saved"] for entry in scripts) / len(scripts)
+        print(f"Overall recall {report['recall']:.1%}, {report['model_calls_saved_per_script']:.1f} model calls saved per script")
+    return report
+
+def measure_scaling(args):
+    # Time the bundled scripts with different numbers of worker processes.
+    # 0 workers runs in this process with torch's default threading.
+    scripts = load_scripts(args.directory)
+    report = {"threads_per_worker": args.threads, "runs": []}
+    baseline = None
+
+    for workers in args.workers:
+        config.PROCESS_WORKERS = workers
+        config.THREADS_PER_WORKER = args.threads
+        # Warm up (and, with workers, start and load every process) untimed
+        run_analysis(scripts[0][1])
+
+        start = time.perf_counter()
+        triggers = {name: run_analysis(script)["final_triggers"] for name, script in scripts}
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        # This process plus its worker processes, with the model loaded in each
+        memory = memory_report()
+
+        run = {
+            "workers": workers,
+            "seconds": elapsed,
+            "scripts_per_second": len(scripts) / elapsed,
+            "speedup": baseline / elapsed,
+            "memory": memory,
+            "triggers": triggers
+        }
+        report["runs"].append(run)
+        print(
+            f"{workers} workers x {args.threads} threads: {elapsed:.2f}s ({run['speedup']:.2f}x), "
+            f"RSS {memory['total_rss_mb']:.0f} MB / PSS {memory['total_pss_mb']:.0f} MB in {len(memory['processes'])} processes"
+        )
+
+    shutdown_process_pool()
+    return report
+
+def cascade_models(real):
+    # The small and large models to cascade: the configured Flan-T5 models,
+    # or two stand-ins (the small one less confident) that need no network
+    if real:
+        return get_model(config.CASCADE_SMALL_MODEL), get_model()
+    return (
+        KeywordModelHandle(trigger_categories, "stand-in-small", sharpness=0.6),
+        KeywordModelHandle(trigger_categories, "stand-in-large", sharpness=1.0)
+    )
+
+def check_cascade(args):
+    # Check the cascade against the small and large models on their own:
+    # answers the small model is sure about must be the small model's, the
+    # rest the large model's, the escalation count must follow the margin
+    # rule, and a margin nothing can pass must reproduce the large model
+    config.PREFILTER = False
+    config.EARLY_EXIT = False
+    config.CASCADE_MARGIN = args.margin
+    small, large = cascade_models(args.real)
+    report = {"small": small.model_id, "large": large.model_id, "margin": args.margin, "scripts": []}
+    passed = True
+
+    for name, script in load_scripts(args.directory):
+        small_only = run_analysis(script, handle=small)
+        large_only = run_analysis(script, handle=large)
+        cascaded, elapsed = timed_analysis(script, handle=large, small_handle=small)
+
+        texts = [chunk.text for chunk in chunk_script(script, large.tokenizer)]
+        items = [(chunk_idx, category) for chunk_idx in range(len(texts)) for category in trigger_categories]
+        small_verdicts = dict(zip(items, classify(small, texts, items, "batched", config.DECODING, config.PROMPT_ENGINE)))
+        escalated = {(texts[chunk_idx], category) for (chunk_idx, category), verdict in small_verdicts.items() if needs_escalation(verdict, args.margin)}
+
+        wrong = 0
+        for (chunk_idx, category), verdict in small_verdicts.items():
+            source = large_only if (texts[chunk_idx], category) in escalated else small_only
+            wrong += cascaded["chunk_labels"][chunk_idx][category] != source["chunk_labels"][chunk_idx][category]
+
+        config.CASCADE_MARGIN = float("inf")
+        always_escalated = run_analysis(script, handle=large, small_handle=small)
+        config.CASCADE_MARGIN = args.margin
+
+        stats = cascaded["stats"]
+        entry = {
+            "script": name,
+            "seconds": elapsed,
+            "pairs": stats.get("cascade_pairs", 0),
+            "escalated": stats.get("cascade_escalated", 0),
+            "expected_escalated": len(escalated),
+            "escalation_rate": stats.get("cascade_escalation_rate", 0.0),
+            "wrong_source": wrong,
+            "agreement_with_large": label_agreement(large_only, cascaded),
+            "triggers": sorted(cascaded["final_triggers"]),
+            "large_triggers": sorted(large_only["final_triggers"]),
+            "always_escalated_matches_large": always_escalated["chunk_labels"] == large_only["chunk_labels"]
+        }
+        entry["passed"] = entry["wrong_source"] == 0 and entry["escalated"] == entry["expected_escalated"] and entry["always_escalated_matches_large"]
+        passed = passed and entry["passed"]
+        report["scripts"].append(entry)
+        print(
+            f"{name}: escalated {entry['escalated']}/{entry['pairs']} ({entry['escalation_rate']:.1%}), "
+            f"agreement with large {entry['agreement_with_large']:.1%}, {'PASS' if entry['passed'] else 'FAIL'}"
+        )
+
+    report["passed"] = passed
+    print("PASS" if passed else "FAIL")
+    return report
+
+def check_documents(args):
+    # Submit every script twice under one document id, with the verdict cache
+    # off and the prefilter off and on: the unchanged resubmission must reuse
+    # every verdict, never call the model and report the same triggers
+    config.DOCUMENT_STORE_PATH = ""
+    handle = get_model() if args.real else KeywordModelHandle(trigger_categories)
+    report = {"model": handle.model_id, "scripts": []}
+    passed = True
+
+    for prefilter in (False, True):
+        config.PREFILTER = prefilter
+        for name, script in load_scripts(args.directory):
+            document_id = f"benchmark-{name}-{'prefilter' if prefilter else 'full'}"
+            first = run_analysis(script, handle=handle, document_id=document_id)
+            before = metrics.snapshot()
+            again = run_analysis(script, handle=handle, document_id=document_id)
+            measured = metrics.difference(before, metrics.snapshot())
+
+            entry = {
+                "script": name,
+                "prefilter": prefilter,
+                "reused": again["stats"].get("document_reused", 0),
+                "inferred": again["stats"].get("document_inferred", 0),
+                "model_calls": measured["counters"].get("model_calls", 0),
+                "same_triggers": sorted(again["final_triggers"]) == sorted(first["final_triggers"])
+            }
+            entry["passed"] = entry["inferred"] == 0 and entry["model_calls"] == 0 and entry["same_triggers"]
+            passed = passed and entry["passed"]
+            report["scripts"].append(entry)
+            print(
+                f"{name} (prefilter {'on' if prefilter else 'off'}): reused {entry['reused']}, re-inferred {entry['inferred']}, "
+                f"{entry['model_calls']} model calls, {'PASS' if entry['passed'] else 'FAIL'}"
+            )
+
+    report["passed"] = passed
+    print("PASS" if passed else "FAIL")
+    return report
+
+def peak_rss_mb():
+    # Peak resident set size of this process so far (ru_maxrss is in KiB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_suite(args):
+    # Time every script, split the time across the pipeline stages, and
+    # compare the triggers with the recorded golden outputs. With --fake the
+    # model is an offline stand-in, which profiles the harness, chunking and
+    # aggregation overhead without weights.
+    handle = KeywordModelHandle(trigger_categories) if args.fake else get_model()
+    scripts = load_scripts(args.directory)
+    if not args.fake and scripts:
+        # Untimed run so lazy initialisation (calibration priors, kernels) isn't measured
+        run_analysis(scripts[0][1], handle=handle)
+
+    golden = {}
+    if os.path.exists(args.golden):
+        with open(args.golden, encoding="utf-8") as f:
+            golden = json.load(f)
+    expected = golden.get(handle.model_id, {})
+
+    report = {
+        "model": handle.model_id,
+        "settings": {
+            "inference_mode": config.INFERENCE_MODE,
+            "decoding": config.DECODING,
+            "prompt_engine": config.PROMPT_ENGINE,
+            "chunker": config.CHUNKER,
+            "prefilter": config.PREFILTER,
+            "early_exit": config.EARLY_EXIT,
+            "process_workers": config.PROCESS_WORKERS
+        },
+        "scripts": []
+    }
+
+    for name, script in scripts:
+        before = metrics.snapshot()
+        analysis, elapsed = timed_analysis(script, handle=handle)
+        measured = metrics.difference(before, metrics.snapshot())
+
+        stages = {stage: measured["stages"].get(stage, {}).get("seconds", 0.0) for stage in ("chunk", "tokenize", "generate", "decode")}
+        triggers = sorted(analysis["final_triggers"])
+        entry = {
+            "script": name,
+            "seconds": elapsed,
+            "chunks": analysis["chunks"],
+            "pairs": measured["counters"].get("pairs", 0),
+            "model_calls": measured["counters"].get("model_calls", 0),
+            "tokens": measured["counters"].get("tokens", 0),
+            "stage_seconds": stages,
+            "other_seconds": max(0.0, elapsed - sum(stages.values())),
+            "peak_rss_mb": peak_rss_mb(),
+            "triggers": triggers,
+            "golden": expected.get(name)
+        }
+        entry["golden_match"] = entry["golden"] is None or entry["golden"] == triggers
+        report["scripts"].append(entry)
+        print(
+            f"{name}: {elapsed:.2f}s, {entry['chunks']} chunks, {entry['model_calls']} model calls, {entry['tokens']} tokens, "
+            f"tokenize {stages['tokenize']:.2f}s / generate {stages['generate']:.2f}s / decode {stages['decode']:.2f}s, "
+            f"peak RSS {entry['peak_rss_mb']:.0f} MB, triggers {'match' if entry['golden_match'] else 'DIFFER from'} golden"
+        )
+
+    scripts = report["scripts"]
+    report["seconds"] = sum(entry["seconds"] for entry in scripts)
+    report["passed"] = all(entry["golden_match"] for entry in scripts)
+
+    if args.update_golden:
+        golden[handle.model_id] = {entry["script"]: entry["triggers"] for entry in scripts}
+        with open(args.golden, "w", encoding="utf-8") as f:
+            json.dump(golden, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Recorded golden triggers for {handle.model_id} in {args.golden}")
+    elif not expected:
+        print(f"No golden triggers recorded for {handle.model_id}; run with --update-golden to record them")
+
+    print(f"Total {report['seconds']:.2f}s, golden outputs {'PASS' if report['passed'] else 'FAIL'}")
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks and accuracy checks for TREAT")
+    parser.add_argument("--directory", default=TEST_FILES_DIR, help="Directory of scripts to analyze")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    parser.add_argument("--use-cache", action="store_true", help="Answer from the verdict cache (off by default so timings are real)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("engines", help="Compare the shared-encoder engine with the per-category prompt")
+    scaling = subparsers.add_parser("scaling", help="Measure throughput with different numbers of worker processes")
+    scaling.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker process counts to try")
+    scaling.add_argument("--threads", type=int, default=1, help="Torch threads per worker")
+
+    parity = subparsers.add_parser("parity", help="Compare inference backends with torch-fp32")
+    parity.add_argument("--backends", nargs="+", default=[b for b in BACKENDS if b != "torch-fp32"], choices=list(BACKENDS), help="Backends to check")
+
+    prefilter = subparsers.add_parser("prefilter", help="Measure the lexical prefilter's recall and savings")
+    prefilter.add_argument("--min-matches", type=int, default=config.PREFILTER_MIN_MATCHES, help="Lexicon hits needed to reach the model")
+
+    suite = subparsers.add_parser("suite", help="Per-script timings, resource use and golden-output regression check")
+    suite.add_argument("--fake", action="store_true", help="Use an offline stand-in model instead of Flan-T5")
+    suite.add_argument("--golden", default=GOLDEN_PATH, help="JSON file of expected triggers")
+    suite.add_argument("--update-golden", action="store_true", help="Record this run's triggers as the golden outputs")
+
+    cascade = subparsers.add_parser("cascade", help="Check the small-to-large model cascade")
+    cascade.add_argument("--margin", type=float, default=config.CASCADE_MARGIN, help="Escalate answers whose top two labels are closer than this")
+    cascade.add_argument("--real", action="store_true", help="Use the configured Flan-T5 models instead of offline stand-ins")
+
+    documents = subparsers.add_parser("documents", help="Check that an unchanged document resubmission reuses every verdict")
+    documents.add_argument("--real", action="store_true", help="Use the configured Flan-T5 model instead of an offline stand-in")
+
+    args = parser.parse_args(argv)
+    config.CACHE_ENABLED = args.use_cache
+    commands = {
+        "engines": compare_engines,
+        "scaling": measure_scaling,
+        "parity": check_backend_parity,
+        "prefilter": measure_prefilter,
+        "cascade": check_cascade,
+        "documents": check_documents,
+        "suite": run_suite
+    }
+    report = commands[args.command](args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    # Non-zero exit status when a check fails, so CI can gate on it
+    if not report.get("passed", True):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+# gunicorn -c gunicorn.conf.py wsgi:application
+# The master imports the app (and the model weights, see wsgi.py) once before
+# forking, so workers are ready as soon as they start
+preload_app = True
+workers = 2
+threads = 4
+bind = "127.0.0.1:5000"
+# Long scripts are analysed synchronously by /upload
+timeout = 600
+
+def post_fork(server, worker):
+    # The master never runs inference (forking after torch has started its
+    # thread pools is unsafe), so each worker warms up on its own thread
+    from app.registry import registry
+    registry.warm_up_in_background()
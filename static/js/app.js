@@ -1,3 +1,63 @@
+// Display the final triggers in the results div
+function showTriggers(resultsDiv, triggers) {
+    resultsDiv.innerHTML = `<span>Triggers:</span> ${triggers.join(', ')}`;
+}
+
+// Follow a background job through its event stream until it finishes
+function followJob(jobId, resultsDiv) {
+    return new Promise((resolve, reject) => {
+        const events = new EventSource(`/jobs/${jobId}/events`); // Subscribe to the job's Server-Sent Events
+
+        // Show progress after every analysed chunk
+        events.addEventListener('chunk', (event) => {
+            const update = JSON.parse(event.data);
+            resultsDiv.innerHTML = `<span>Analyzing:</span> ${update.chunks_done}/${update.chunks_total} chunks`;
+        });
+
+        // The job finished: show the triggers
+        events.addEventListener('done', (event) => {
+            events.close();
+            resolve(JSON.parse(event.data).triggers);
+        });
+
+        // The job failed or was cancelled on the server
+        ['failed', 'cancelled'].forEach((name) => {
+            events.addEventListener(name, (event) => {
+                events.close();
+                reject(new Error(JSON.parse(event.data).error || `Job ${name}`));
+            });
+        });
+
+        // The stream itself broke (e.g. a proxy dropped it): fall back to polling
+        events.onerror = () => {
+            events.close();
+            pollJob(jobId, resultsDiv).then(resolve, reject);
+        };
+    });
+}
+
+// Poll the job status until it finishes
+async function pollJob(jobId, resultsDiv) {
+    while (true) {
+        const response = await fetch(`/jobs/${jobId}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        const job = await response.json();
+        if (job.status === 'done') {
+            return job.triggers;
+        }
+        if (job.status === 'failed' || job.status === 'cancelled') {
+            throw new Error(job.error || `Job ${job.status}`);
+        }
+        if (job.chunks_total) {
+            resultsDiv.innerHTML = `<span>Analyzing:</span> ${job.chunks_done}/${job.chunks_total} chunks`;
+        }
+        await new Promise((resolve) => setTimeout(resolve, 2000)); // Wait before polling again
+    }
+}
+
 // Add an event listener for the form submission
 document.getElementById('text-form').addEventListener('submit', async function(event) {
     event.preventDefault(); // Prevent the default form submission behavior
@@ -9,8 +69,8 @@ document.getElementById('text-form').addEventListener('submit', async function(e
     loadingBar.style.display = 'block'; // Display the loading bar
 
     try {
-        // Make a POST request to the server with the text input
-        const response = await fetch('/upload', {
+        // Start a background analysis job on the server with the text input
+        const response = await fetch('/jobs', {
             method: 'POST', // Use the POST method
             headers: {
                 'Content-Type': 'application/json' // Set the Content-Type header
@@ -23,9 +83,10 @@ document.getElementById('text-form').addEventListener('submit', async function(e
             throw new Error(`HTTP error! status: ${response.status}`); // Throw an error with the status code
         }
 
-        // Parse the JSON response from the server
-        const result = await response.json();
-        resultsDiv.innerHTML = `<span>Triggers:</span> ${result.triggers.join(', ')}`; // Display the triggers in the results div
+        // Parse the JSON response from the server and follow the job until it finishes
+        const job = await response.json();
+        const triggers = window.EventSource ? await followJob(job.job_id, resultsDiv) : await pollJob(job.job_id, resultsDiv);
+        showTriggers(resultsDiv, triggers); // Display the triggers in the results div
     } catch (error) {
         // Handle any errors that occurred during the request
         console.error('Error analyzing text:', error); // Log the error to the console
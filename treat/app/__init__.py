@@ -19,3 +19,16 @@ CORS(app)
 
 # Import routes after initializing the Flask app to avoid circular import issues
 from app import routes
+
+# Load the model now instead of on the first request: "background" loads and
+# warms it up on a thread while the app already serves pages; "preload" loads
+# the weights before returning (without running inference), so pre-fork WSGI
+# servers can load them once in the master and share them with every worker
+from app import config
+from app.registry import registry
+if config.LOAD_MODEL == "background":
+    registry.load_in_background()
+elif config.LOAD_MODEL == "preload":
+    registry.get(warm=False)
+elif config.LOAD_MODEL != "on-demand":
+    raise ValueError(f"Unknown TREAT_LOAD_MODEL: {config.LOAD_MODEL}")
@@ -0,0 +1,164 @@
+import logging
+
+from app.metrics import chunk_log
+from app.scoring import LABELS
+
+# Confidence a category needs (YES = 1, MAYBE = 0.5 per chunk, divided by
+# the number of chunks) to be reported as a trigger
+CONFIDENCE_THRESHOLD = 0.6
+
+# How much each answer adds to a category's score
+LABEL_SCORES = {"YES": 1, "MAYBE": 0.5}
+
+class TriggerAggregator:
+    # Accumulates verdicts for (distinct chunk, category) pairs into the
+    # per-category scores and per-chunk details of an analysis. Because scores
+    # only ever grow, a category's outcome is fixed as soon as it crosses the
+    # threshold, or once even all-YES answers for its remaining chunks could
+    # no longer lift it over; such categories can be retired early.
+    def __init__(self, categories, chunk_to_unique, threshold=CONFIDENCE_THRESHOLD):
+        self.categories = categories
+        self.threshold = threshold
+        self.total = len(chunk_to_unique)
+
+        # Original chunk positions that share each distinct chunk
+        self.duplicates = {}
+        for chunk_idx, unique_idx in enumerate(chunk_to_unique):
+            self.duplicates.setdefault(unique_idx, []).append(chunk_idx)
+
+        self.identified_triggers = {}
+        self.chunk_triggers = {i: [] for i in range(self.total)}  # Track triggers per chunk
+        self.chunk_labels = {i: {} for i in range(self.total)}  # Raw answer per chunk and category
+        self.probability_totals = {}
+        self.scores = dict.fromkeys(categories, 0)
+        self.evaluated = dict.fromkeys(categories, 0)
+        self.retired = set()
+
+        self._answered = set()
+        self._resolved = dict.fromkeys(self.duplicates, 0)
+        self._completed = []
+        self.chunks_done = 0
+
+    def record(self, unique_idx, category, verdict):
+        # Add one verdict, counting it once for every chunk that shares the text
+        mapped_name = self.categories[category]["mapped_name"]
+        first_word = verdict["label"]
+        self._answered.add((unique_idx, category))
+
+        for chunk_idx in self.duplicates[unique_idx]:
+            self.chunk_labels[chunk_idx][category] = first_word
+            self.evaluated[category] += 1
+            chunk_log.debug(f"Chunk {chunk_idx + 1}/{self.total}, Category: {mapped_name}, Response: {first_word}")
+
+            if first_word in LABEL_SCORES:
+                self.scores[category] += LABEL_SCORES[first_word]
+                self.identified_triggers[mapped_name] = self.identified_triggers.get(mapped_name, 0) + LABEL_SCORES[first_word]
+                self.chunk_triggers[chunk_idx].append(mapped_name if first_word == "YES" else f"{mapped_name} (Maybe)")
+
+            if verdict["probs"] is not None:
+                totals = self.probability_totals.setdefault(mapped_name, dict.fromkeys(LABELS, 0.0))
+                for label in LABELS:
+                    totals[label] += verdict["probs"][label]
+
+        self._resolve(unique_idx)
+
+    def _resolve(self, unique_idx):
+        # A chunk is complete once every category is answered or retired
+        self._resolved[unique_idx] += 1
+        if self._resolved[unique_idx] == len(self.categories):
+            self._completed.append(unique_idx)
+
+    def is_decided(self, category):
+        # True when no further answers can change whether category is a trigger
+        remaining = self.total - self.evaluated[category]
+        return (
+            self.scores[category] / self.total > self.threshold
+            or (self.scores[category] + remaining) / self.total <= self.threshold
+        )
+
+    def retire_decided(self):
+        # Retire every category whose outcome is fixed; returns the newly retired ones
+        retired = [category for category in self.categories if category not in self.retired and self.is_decided(category)]
+        for category in retired:
+            self.retired.add(category)
+            for unique_idx in self.duplicates:
+                if (unique_idx, category) not in self._answered:
+                    self._resolve(unique_idx)
+            logging.info(f"Retired {category} after {self.evaluated[category]}/{self.total} chunks")
+        return retired
+
+    def completed_chunks(self):
+        # Yield the original chunk positions completed since the last call, in
+        # order, counting each one as done as it is yielded
+        completed = sorted(chunk_idx for unique_idx in self._completed for chunk_idx in self.duplicates[unique_idx])
+        self._completed = []
+        for chunk_idx in completed:
+            self.chunks_done += 1
+            yield chunk_idx
+
+    def progress(self, chunk_idx):
+        # Progress update for one completed chunk
+        return {
+            "chunk": chunk_idx,
+            "chunks_done": self.chunks_done,
+            "chunks_total": self.total,
+            "triggers": self.chunk_triggers[chunk_idx],
+            "scores": {name: count / self.total for name, count in self.identified_triggers.items()}
+        }
+
+    def final_triggers(self):
+        # Improved trigger detection logic
+        final_triggers = []
+        for category, info in self.categories.items():
+            if self.scores[category]:
+                confidence_score = self.scores[category] / self.total
+                logging.info(f"Trigger: {info['mapped_name']}, Confidence Score: {confidence_score:.2f}")
+
+                if confidence_score > self.threshold:
+                    final_triggers.append(info["mapped_name"])
+        return final_triggers
+
+    def category_scores(self):
+        # Average label probabilities per category (only available when scoring)
+        return {
+            mapped_name: {label: total / self.total for label, total in totals.items()}
+            for mapped_name, totals in self.probability_totals.items()
+        }
+
+def exhaustive_plan(unique_count, categories, step):
+    # Every category for every distinct chunk, a few chunks at a time
+    for start in range(0, unique_count, step):
+        yield [(unique_idx, category) for unique_idx in range(start, min(start + step, unique_count)) for category in categories]
+
+def early_exit_priorities(unique_chunks, aggregator, prefilter):
+    # Order each category's chunks so its outcome is settled as early as
+    # possible: chunks shared by many positions first, then, for categories
+    # whose lexical evidence suggests they will cross the threshold, the
+    # chunks with most lexicon hits (positive answers settle them), and for
+    # the rest the chunks with fewest hits (negative answers settle them)
+    priorities = {}
+    for category in aggregator.categories:
+        hits = [prefilter.score(chunk, category) or 0 for chunk in unique_chunks]
+        weights = [len(aggregator.duplicates[unique_idx]) for unique_idx in range(len(unique_chunks))]
+        hit_share = sum(weight for weight, hit in zip(weights, hits) if hit) / aggregator.total
+        direction = -1 if hit_share > aggregator.threshold else 1
+        priorities[category] = sorted(range(len(unique_chunks)), key=lambda i: (-weights[i], direction * hits[i]))
+    return priorities
+
+def early_exit_plan(aggregator, priorities, step):
+    # Each open category advances through its own chunk order; categories are
+    # dropped from the plan as soon as the aggregator retires them. The plan is
+    # consumed one step at a time, after the previous step's verdicts are in.
+    positions = dict.fromkeys(priorities, 0)
+    while True:
+        aggregator.retire_decided()
+        items = []
+        for category, order in priorities.items():
+            if category in aggregator.retired:
+                continue
+            start = positions[category]
+            items.extend((unique_idx, category) for unique_idx in order[start:start + step])
+            positions[category] = start + step
+        if not items:
+            return
+        yield items
@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import struct
+
+from app import config
+
+# Inference backends: each loader returns (model, device) for a model name.
+# Every backend exposes the same generate()/forward() interface, so the
+# analysis code doesn't need to know which one is in use. torch and
+# transformers are imported on first load, which keeps app startup fast.
+
+def load_torch_fp32(model_name):
+    # The original PyTorch path: fp16 on GPU, fp32 on CPU
+    import torch
+    from transformers import AutoModelForSeq2SeqLM
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if config.MMAP_WEIGHTS:
+        if device == "cpu":
+            return load_mmap(model_name), device
+        logging.warning("TREAT_MMAP_WEIGHTS only applies on CPU; loading the weights onto the GPU instead")
+    model = AutoModelForSeq2SeqLM.from_pretrained(
+        model_name,
+        torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+        device_map="auto",
+        low_cpu_mem_usage=True
+    )
+    model.eval()
+    return model, device
+
+# safetensors dtype names and the torch dtypes they map to
+SAFETENSORS_DTYPES = {
+    "F32": "float32", "F16": "float16", "BF16": "bfloat16", "F64": "float64",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool"
+}
+
+def safetensors_files(model_name):
+    # The model's .safetensors files, from a local directory or the Hugging Face cache
+    if os.path.isdir(model_name):
+        directory = model_name
+    else:
+        from huggingface_hub import snapshot_download
+        directory = snapshot_download(model_name, allow_patterns=["*.safetensors", "*.json"])
+    files = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".safetensors"))
+    if not files:
+        raise RuntimeError(f"{model_name} has no safetensors weights, which TREAT_MMAP_WEIGHTS needs")
+    return files
+
+def mmap_safetensors(path):
+    # Tensors that point straight into a private, read-only mapping of the
+    # file: pages come from the OS page cache, so every process mapping the
+    # same file shares one physical copy of the weights
+    import torch
+    with open(path, "rb") as f:
+        header_length = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_length))
+    header.pop("__metadata__", None)
+
+    size = os.path.getsize(path)
+    storage = torch.UntypedStorage.from_file(path, False, size)
+    data = torch.empty(0, dtype=torch.uint8).set_(storage)
+    start = 8 + header_length
+
+    tensors = {}
+    for name, info in header.items():
+        dtype = getattr(torch, SAFETENSORS_DTYPES[info["dtype"]])
+        begin, end = info["data_offsets"]
+        raw = data[start + begin:start + end]
+        if (start + begin) % torch.empty(0, dtype=dtype).element_size():
+            # Misaligned for this dtype: this tensor has to be copied
+            raw = raw.clone()
+        tensors[name] = raw.view(dtype).reshape(info["shape"])
+    return tensors
+
+def load_mmap(model_name):
+    # Build the model on the meta device (no memory at all), then make its
+    # parameters the memory-mapped tensors themselves instead of copying
+    # them, so loading needs no second copy of the weights either
+    import torch
+    from transformers import AutoConfig, AutoModelForSeq2SeqLM
+    model_config = AutoConfig.from_pretrained(model_name)
+    with torch.device("meta"):
+        model = AutoModelForSeq2SeqLM.from_config(model_config)
+
+    state = {}
+    for path in safetensors_files(model_name):
+        state.update(mmap_safetensors(path))
+    model.load_state_dict(state, strict=False, assign=True)
+    # Shared embeddings are only stored once in the file
+    model.tie_weights()
+
+    missing = [name for name, tensor in list(model.named_parameters()) + list(model.named_buffers()) if tensor.is_meta]
+    if missing:
+        raise RuntimeError(f"Weights missing from the safetensors files of {model_name}: {', '.join(missing[:5])}")
+    if any(parameter.dtype != torch.float32 for parameter in model.parameters()):
+        logging.warning(f"{model_name} weights are not stored as float32; they are used as stored")
+    model.eval()
+    logging.info(f"Memory-mapped the weights of {model_name}")
+    return model
+
+def load_torch_int8(model_name):
+    # PyTorch dynamic quantization: Linear weights stored as INT8 and
+    # activations quantized on the fly. CPU only.
+    import torch
+    from transformers import AutoModelForSeq2SeqLM
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+    model.eval()
+    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model, "cpu"
+
+def load_onnx(model_name):
+    # ONNX Runtime on CPU, through Hugging Face Optimum (optional dependency).
+    # The encoder/decoder export is saved under ONNX_DIR and reused afterwards.
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError:
+        raise RuntimeError("The onnx backend needs Hugging Face Optimum: pip install optimum[onnxruntime]")
+
+    export_dir = os.path.join(config.ONNX_DIR, model_name.replace("/", "--"))
+    if os.path.isdir(export_dir):
+        model = ORTModelForSeq2SeqLM.from_pretrained(export_dir, provider="CPUExecutionProvider")
+    else:
+        logging.info(f"Exporting {model_name} to ONNX in {export_dir}")
+        model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True, provider="CPUExecutionProvider")
+        model.save_pretrained(export_dir)
+    return model, "cpu"
+
+BACKENDS = {
+    "torch-fp32": load_torch_fp32,
+    "torch-int8": load_torch_int8,
+    "onnx": load_onnx
+}
+
+def load_backend(model_name, backend):
+    # Load the tokenizer and the model for the requested backend
+    from transformers import AutoTokenizer
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend} (choose from {', '.join(BACKENDS)})")
+    tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+    model, device = BACKENDS[backend](model_name)
+    return tokenizer, model, device
@@ -0,0 +1,181 @@
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+def content_key(*parts):
+    # Stable content hash of any JSON-serialisable parts
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# Share of CACHE_DISK_ENTRIES freed whenever the SQLite file goes over it
+EVICTION_SLACK = 0.1
+
+class VerdictCache:
+    # Two-tier cache of verdicts: a bounded in-memory LRU in front of an
+    # optional SQLite file. Entries remember the category and the fingerprint
+    # of its definition so stale entries can be purged when it changes.
+    def __init__(self, path=None, memory_entries=10000, disk_entries=1000000):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._db = None
+        # Estimate of the rows in the SQLite file: counted on open, then kept
+        # up to date with this process's writes. Other processes sharing the
+        # file (e.g. gunicorn workers) are only seen when it is recounted:
+        # whenever the estimate goes over the bound, and after every
+        # EVICTION_SLACK share of the bound added by this process.
+        self._disk_count = 0
+        self._added_since_count = 0
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts ("
+                "key TEXT PRIMARY KEY, category TEXT, fingerprint TEXT, verdict TEXT, last_used REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS verdicts_last_used ON verdicts (last_used)")
+            self._db.commit()
+            self._disk_count = self._db.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+
+    def _remember(self, key, entry):
+        # Insert into the memory tier, evicting the least recently used entry
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def get_many(self, keys):
+        # Return {key: verdict} for every key found in either tier
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = entry[2]
+                    self.memory_hits += 1
+                else:
+                    missing.append(key)
+
+            if missing and self._db is not None:
+                now = time.time()
+                # Stay well under SQLite's limit on query parameters
+                for start in range(0, len(missing), 500):
+                    batch = missing[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, category, fingerprint, verdict FROM verdicts WHERE key IN ({','.join('?' * len(batch))})",
+                        batch
+                    ).fetchall()
+                    for key, category, fingerprint, verdict in rows:
+                        verdict = json.loads(verdict)
+                        found[key] = verdict
+                        self._remember(key, (category, fingerprint, verdict))
+                        self.disk_hits += 1
+                    if rows:
+                        self._db.executemany("UPDATE verdicts SET last_used = ? WHERE key = ?", [(now, row[0]) for row in rows])
+                self._db.commit()
+
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, entries):
+        # Store (key, category, fingerprint, verdict) entries in both tiers
+        with self._lock:
+            for key, category, fingerprint, verdict in entries:
+                self._remember(key, (category, fingerprint, verdict))
+
+            if self._db is not None and entries:
+                now = time.time()
+                # Keys already in the file are replaced, not added (primary key lookups)
+                keys = list({entry[0] for entry in entries})
+                existing = 0
+                for start in range(0, len(keys), 500):
+                    batch = keys[start:start + 500]
+                    existing += self._db.execute(
+                        f"SELECT COUNT(*) FROM verdicts WHERE key IN ({','.join('?' * len(batch))})",
+                        batch
+                    ).fetchone()[0]
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO verdicts (key, category, fingerprint, verdict, last_used) VALUES (?, ?, ?, ?, ?)",
+                    [(key, category, fingerprint, json.dumps(verdict), now) for key, category, fingerprint, verdict in entries]
+                )
+                self._disk_count += len(keys) - existing
+                self._added_since_count += len(keys) - existing
+                if self._disk_count > self.disk_entries or self._added_since_count >= self.disk_entries * EVICTION_SLACK:
+                    # Recount inside this write transaction, so rows other
+                    # processes added are included, then evict the least
+                    # recently used rows down to the low-water mark (which
+                    # keeps recounts to one per EVICTION_SLACK of churn)
+                    self._disk_count = self._db.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+                    self._added_since_count = 0
+                    if self._disk_count > self.disk_entries:
+                        target = int(self.disk_entries * (1 - EVICTION_SLACK))
+                        excess = self._db.execute(
+                            "DELETE FROM verdicts WHERE key IN (SELECT key FROM verdicts ORDER BY last_used LIMIT ?)",
+                            (self._disk_count - target,)
+                        ).rowcount
+                        self._disk_count -= excess
+                        self.evictions += excess
+                self._db.commit()
+
+    def invalidate(self, fingerprints=None):
+        # Drop entries whose category definition no longer matches the given
+        # {category: fingerprint} map, or everything when no map is given
+        with self._lock:
+            if fingerprints is None:
+                dropped = len(self._memory)
+                self._memory.clear()
+                if self._db is not None:
+                    dropped += self._db.execute("DELETE FROM verdicts").rowcount
+                    self._db.commit()
+                    self._disk_count = 0
+            else:
+                stale = [
+                    key for key, (category, fingerprint, _) in self._memory.items()
+                    if fingerprints.get(category) != fingerprint
+                ]
+                for key in stale:
+                    del self._memory[key]
+                dropped = len(stale)
+                if self._db is not None:
+                    rows = self._db.execute("SELECT DISTINCT category, fingerprint FROM verdicts").fetchall()
+                    for category, fingerprint in rows:
+                        if fingerprints.get(category) != fingerprint:
+                            deleted = self._db.execute(
+                                "DELETE FROM verdicts WHERE category = ? AND fingerprint = ?",
+                                (category, fingerprint)
+                            ).rowcount
+                            dropped += deleted
+                            self._disk_count -= deleted
+                    self._db.commit()
+
+        if dropped:
+            logging.info(f"Invalidated {dropped} cached verdicts")
+        return dropped
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,29 @@
+# Two-tier classification: a small model answers every pair and only the
+# answers it is unsure about are escalated to the large model.
+
+def margin(probs):
+    # Gap between the most and second most likely labels
+    top = sorted(probs.values(), reverse=True)
+    return top[0] - top[1]
+
+def needs_escalation(verdict, min_margin):
+    # MAYBE answers always escalate; scored answers also escalate when the
+    # small model's top two labels are closer than min_margin
+    if verdict["label"] == "MAYBE":
+        return True
+    return verdict["probs"] is not None and margin(verdict["probs"]) < min_margin
+
+def cascade(classify_small, classify_large, work_items, min_margin, stats=None):
+    # classify_small/classify_large take a list of work items and return one
+    # verdict per item. Returns the merged verdicts, in order.
+    verdicts = classify_small(work_items)
+    escalate = [n for n, verdict in enumerate(verdicts) if needs_escalation(verdict, min_margin)]
+
+    if escalate:
+        for n, verdict in zip(escalate, classify_large([work_items[n] for n in escalate])):
+            verdicts[n] = verdict
+
+    if stats is not None:
+        stats["cascade_pairs"] = stats.get("cascade_pairs", 0) + len(work_items)
+        stats["cascade_escalated"] = stats.get("cascade_escalated", 0) + len(escalate)
+    return verdicts
@@ -0,0 +1,22 @@
+import json
+
+# Trigger categories live in a versioned JSON file (categories.json next to
+# this module by default):
+#   {"version": 1, "categories": {"Violence": {"mapped_name": ..., "description": ...}, ...}}
+# Bump the version whenever a category is added, removed or reworded. Cached
+# verdicts and compiled prompts are keyed on each category's actual text, so
+# an edit invalidates them even if the version is not bumped.
+
+def load_categories(path):
+    # Returns (version, {category: {"mapped_name", "description"}}), in file order
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    version = data.get("version")
+    categories = data.get("categories")
+    if not isinstance(version, int) or not isinstance(categories, dict) or not categories:
+        raise ValueError(f"{path} needs an integer 'version' and a non-empty 'categories' object")
+    for category, info in categories.items():
+        if not isinstance(info, dict) or not all(isinstance(info.get(field), str) and info[field] for field in ("mapped_name", "description")):
+            raise ValueError(f"Category {category} in {path} needs a 'mapped_name' and a 'description'")
+    return version, categories
@@ -0,0 +1,208 @@
+from collections import namedtuple
+import bisect
+import logging
+import math
+import random
+import re
+
+# A piece of the script, with the character span it came from
+Chunk = namedtuple("Chunk", ["text", "start", "end"])
+
+# End of a sentence (punctuation plus any closing quotes/brackets, then
+# whitespace) or a blank line between paragraphs
+SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s+|\n\s*\n")
+
+# Runs of non-whitespace characters
+WORD = re.compile(r"\S+")
+
+def chunk_words(script, chunk_size=1000, overlap=20):
+    # Original word-based chunker: packs words until the chunk reaches
+    # chunk_size characters, carrying the last few words over to the next chunk
+    script_chunks = []
+    current_chunk = []
+    current_length = 0
+
+    for match in WORD.finditer(script):
+        current_chunk.append(match)
+        current_length += len(match.group()) + 1
+
+        if current_length >= chunk_size:
+            script_chunks.append(_join_words(current_chunk))
+            # Keep last few words for overlap (none when the share rounds down to zero)
+            keep = int(len(current_chunk) * (overlap/chunk_size))
+            current_chunk = current_chunk[-keep:] if keep else []
+            current_length = sum(match.end() - match.start() + 1 for match in current_chunk)
+
+    if current_chunk:
+        script_chunks.append(_join_words(current_chunk))
+
+    return script_chunks
+
+def _join_words(matches):
+    return Chunk(" ".join(match.group() for match in matches), matches[0].start(), matches[-1].end())
+
+def _boundary_flags(script, offsets, pattern):
+    # Mark the tokens that start right after a match of pattern, in one linear
+    # pass over the matches and the token offsets
+    flags = [False] * len(offsets)
+    token = 0
+    for match in pattern.finditer(script):
+        while token < len(offsets) and offsets[token][0] < match.end():
+            token += 1
+        if token < len(offsets):
+            flags[token] = True
+    return flags
+
+def _last_flag_before(flags):
+    # For every position i, the largest j <= i with flags[j] set (or -1)
+    last = []
+    current = -1
+    for i, flag in enumerate(flags):
+        if flag:
+            current = i
+        last.append(current)
+    return last
+
+def chunk_tokens(script, tokenizer, max_tokens, overlap_tokens=8):
+    # Pack the script into chunks of at most max_tokens tokens, using the fast
+    # tokenizer's offset mapping. Chunks end at a sentence boundary when one
+    # falls in the second half of the window, otherwise at a word boundary,
+    # and only split inside a word if the word alone exceeds the budget. The
+    # whole script is tokenized once and every step is linear in its length.
+    if max_tokens < 1:
+        raise ValueError("max_tokens must be at least 1")
+
+    encoding = tokenizer(script, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+    # Drop zero-width tokens (e.g. a lone word-start marker) that map to no text
+    offsets = [(start, end) for start, end in encoding["offset_mapping"] if end > start]
+    total = len(offsets)
+    if not total:
+        return []
+
+    sentence_starts = _last_flag_before(_boundary_flags(script, offsets, SENTENCE_END))
+    word_flags = [True] + [offsets[i][0] > offsets[i - 1][1] for i in range(1, total)]
+    word_starts = _last_flag_before(word_flags)
+    # Sorted token positions that start a word, used to snap the overlap
+    word_start_positions = [i for i, flag in enumerate(word_flags) if flag]
+
+    chunks = []
+    start = 0
+    while start < total:
+        limit = start + max_tokens
+        if limit >= total:
+            end = total
+        else:
+            # Prefer a sentence boundary, then a word boundary, inside the window
+            end = sentence_starts[limit]
+            if end <= start + max_tokens // 2:
+                end = word_starts[limit]
+            if end <= start:
+                end = limit
+
+        chunks.append(Chunk(script[offsets[start][0]:offsets[end - 1][1]], offsets[start][0], offsets[end - 1][1]))
+        if end == total:
+            break
+
+        # Step back by the overlap, snapped forward to the start of a word
+        next_start = end - overlap_tokens
+        position = bisect.bisect_left(word_start_positions, next_start)
+        next_start = word_start_positions[position] if position < len(word_start_positions) else end
+        start = next_start if start < next_start < end else end
+
+    logging.info(f"Packed {total} tokens into {len(chunks)} chunks of at most {max_tokens} tokens")
+    return chunks
+
+# Gear table for the content-defined chunker's rolling hash: a fixed random
+# 64-bit value per byte, so boundaries are the same on every run
+GEAR = [random.Random(f"treat-gear-{byte}").getrandbits(64) for byte in range(256)]
+GEAR_MASK = (1 << 64) - 1
+
+def chunk_content(script, chunk_size=1000, tokenizer=None, max_tokens=None):
+    # Content-defined chunking: a Gear rolling hash over the characters (each
+    # one shifts the hash left, so only the last 64 characters count) decides
+    # the cut points, which therefore depend only on the nearby text. An edit
+    # moves the boundaries around it, and every chunk beyond resynchronises,
+    # so revisions of a script keep most of their chunks. Cuts are only made
+    # at the end of a word, once the chunk has chunk_size / 4 characters, and
+    # forced at 2 * chunk_size; chunks average about chunk_size characters.
+    # With a tokenizer, a chunk over max_tokens is split further by tokens.
+    min_size = max(1, chunk_size // 4)
+    max_size = max(min_size + 1, chunk_size * 2)
+    # Cut points are checked about once per word (~6 characters), so aim for
+    # one hit every (chunk_size - min_size) / 6 checks
+    bits = max(1, round(math.log2(max(2, (chunk_size - min_size) / 6))))
+    mask = ((1 << bits) - 1) << (64 - bits)
+
+    chunks = []
+    words = WORD.finditer(script)
+    current = []
+    current_length = 0
+    hash_value = 0
+    position = 0
+    for match in words:
+        # Roll the hash over the word and the whitespace before it
+        for char in script[position:match.end()]:
+            hash_value = ((hash_value << 1) + GEAR[ord(char) & 0xFF]) & GEAR_MASK
+        position = match.end()
+        current.append(match)
+        current_length += len(match.group()) + 1
+
+        if current_length >= max_size or (current_length >= min_size and not hash_value & mask):
+            chunks.append(_join_words(current))
+            current = []
+            current_length = 0
+
+    if current:
+        chunks.append(_join_words(current))
+
+    if tokenizer is not None and max_tokens:
+        chunks = [piece for chunk in chunks for piece in _fit_tokens(chunk, tokenizer, max_tokens)]
+    logging.info(f"Split {len(script)} characters into {len(chunks)} content-defined chunks")
+    return chunks
+
+def _fit_tokens(chunk, tokenizer, max_tokens):
+    # Split a chunk that is over the token budget (without overlap, so the
+    # pieces only depend on the chunk itself)
+    if len(tokenizer(chunk.text, add_special_tokens=False)["input_ids"]) <= max_tokens:
+        return [chunk]
+    return [
+        Chunk(piece.text, chunk.start + piece.start, chunk.start + piece.end)
+        for piece in chunk_tokens(chunk.text, tokenizer, max_tokens, 0)
+    ]
+
+def stream_chunks(pieces, chunk_text, min_buffer):
+    # Chunk a script that arrives as an iterable of text pieces, yielding
+    # chunks as soon as the text after them has arrived. chunk_text is any of
+    # the chunkers above applied to a string. Once min_buffer characters are
+    # buffered, everything up to the last whitespace is chunked and all but
+    # the last chunk are emitted; the text is then re-chunked from the start
+    # of that last chunk. For the word chunker, and for the content chunker's
+    # hash-defined boundaries, that is where they would have started it
+    # anyway, so the chunks match chunking the whole script at once. The
+    # token chunker (and content chunks split to fit the token budget) can
+    # differ: the restart loses the context before that chunk, so a few
+    # boundaries move slightly.
+    buffer = ""
+    offset = 0
+    next_attempt = min_buffer
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) < next_attempt:
+            continue
+
+        cut = max(buffer.rfind(" "), buffer.rfind("\n"))
+        chunks = chunk_text(buffer[:cut]) if cut > 0 else []
+        if len(chunks) < 2:
+            # Not enough text for a complete chunk yet
+            next_attempt = len(buffer) + min_buffer
+            continue
+
+        for chunk in chunks[:-1]:
+            yield Chunk(chunk.text, chunk.start + offset, chunk.end + offset)
+        keep = chunks[-1].start
+        buffer = buffer[keep:]
+        offset += keep
+        next_attempt = min_buffer
+
+    for chunk in chunk_text(buffer):
+        yield Chunk(chunk.text, chunk.start + offset, chunk.end + offset)
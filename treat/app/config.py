@@ -0,0 +1,147 @@
+import os
+
+# Runtime settings, overridable through environment variables so deployments
+# can tune them without editing the code.
+
+def _env_bool(name, default):
+    # Read a boolean flag from the environment ("1", "true", "yes" and "on" are truthy)
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# Hugging Face model used for script analysis
+MODEL_NAME = os.environ.get("TREAT_MODEL_NAME", "google/flan-t5-large")
+
+# Inference backend: "torch-fp32" (the original PyTorch path), "torch-int8"
+# (PyTorch dynamic INT8 quantization, CPU) or "onnx" (ONNX Runtime on CPU,
+# needs optimum[onnxruntime])
+BACKEND = os.environ.get("TREAT_BACKEND", "torch-fp32")
+
+# Use the torch-fp32 weights straight from a memory-mapped safetensors file
+# (CPU only): processes that load the same model share one physical copy
+MMAP_WEIGHTS = _env_bool("TREAT_MMAP_WEIGHTS", False)
+
+# Where ONNX exports are kept so they are only built once
+ONNX_DIR = os.environ.get("TREAT_ONNX_DIR", os.path.join(os.path.expanduser("~"), ".cache", "treat", "onnx"))
+
+# When to load the model: "on-demand" (first request), "background" (on a
+# thread as soon as the app starts) or "preload" (before the app module
+# finishes importing, for pre-fork WSGI servers). TREAT_EAGER_LOAD=1 is the
+# older spelling of "preload".
+LOAD_MODEL = os.environ.get("TREAT_LOAD_MODEL", "preload" if _env_bool("TREAT_EAGER_LOAD", False) else "on-demand")
+
+# Run a tiny inference right after loading so the first request doesn't pay for it
+WARM_UP = _env_bool("TREAT_WARM_UP", True)
+
+# "batched" runs all (chunk, category) prompts in padded, length-bucketed
+# batches; "sequential" runs them one at a time
+INFERENCE_MODE = os.environ.get("TREAT_INFERENCE_MODE", "batched")
+
+# Distinct chunks analysed per step; progress is reported and cancellation
+# checked between steps
+CHUNKS_PER_STEP = int(os.environ.get("TREAT_CHUNKS_PER_STEP", "8"))
+
+# Most prompts per batch, and most padded tokens (rows * longest row) per batch
+BATCH_SIZE = int(os.environ.get("TREAT_BATCH_SIZE", "16"))
+MAX_BATCH_TOKENS = int(os.environ.get("TREAT_MAX_BATCH_TOKENS", "8192"))
+
+# "score" answers each prompt with one encoder pass and one decoder step,
+# reading the YES/NO/MAYBE probabilities directly; "generate" runs beam-search
+# generation and keeps the first word of the answer
+DECODING = os.environ.get("TREAT_DECODING", "score")
+
+# "per-category" embeds the chunk in a separate prompt for every category;
+# "shared-encoder" encodes each chunk once and asks about every category on
+# the decoder side (score decoding only)
+PROMPT_ENGINE = os.environ.get("TREAT_PROMPT_ENGINE", "per-category")
+
+# Chunks encoded together by the shared-encoder engine
+SHARED_ENCODER_CHUNKS = int(os.environ.get("TREAT_SHARED_ENCODER_CHUNKS", "4"))
+
+# JSON file holding the trigger categories and their version (see categories.py)
+CATEGORIES_PATH = os.environ.get("TREAT_CATEGORIES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "categories.json"))
+
+# Build per-category prompts from pre-tokenized templates, tokenizing each
+# chunk once instead of every full prompt
+COMPILED_PROMPTS = _env_bool("TREAT_COMPILED_PROMPTS", True)
+
+# Calibrate label probabilities against each prompt's content-free bias. Off
+# until benchmark.py shows it improves accuracy on labelled scripts.
+CALIBRATE = _env_bool("TREAT_CALIBRATE", False)
+
+# Sample during generation. Turn off for reproducible answers, which also makes
+# the batched and sequential modes give identical results.
+DO_SAMPLE = _env_bool("TREAT_DO_SAMPLE", True)
+
+# Cache verdicts by content hash: a bounded in-memory LRU in front of a SQLite
+# file. Set TREAT_CACHE_PATH to an empty string to keep the cache in memory only.
+CACHE_ENABLED = _env_bool("TREAT_CACHE", True)
+CACHE_PATH = os.environ.get("TREAT_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "treat", "verdicts.sqlite3"))
+CACHE_MEMORY_ENTRIES = int(os.environ.get("TREAT_CACHE_MEMORY_ENTRIES", "10000"))
+CACHE_DISK_ENTRIES = int(os.environ.get("TREAT_CACHE_DISK_ENTRIES", "1000000"))
+
+# "tokens" packs chunks to the exact token budget left by the longest category
+# prompt, ending them at sentence boundaries; "words" is the original chunker
+# that measures chunks in characters; "content" cuts where a rolling hash of
+# the text says so, so edits only change the chunks around them
+CHUNKER = os.environ.get("TREAT_CHUNKER", "tokens")
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("TREAT_CHUNK_OVERLAP_TOKENS", "8"))
+
+# Chunk size and overlap in characters for the "words" chunker (CHUNK_SIZE is
+# also the average chunk size of the "content" chunker)
+CHUNK_SIZE = int(os.environ.get("TREAT_CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.environ.get("TREAT_CHUNK_OVERLAP", "20"))
+
+# Background analysis jobs: worker threads, most jobs waiting for a worker,
+# and how long finished jobs are kept for polling
+JOB_WORKERS = int(os.environ.get("TREAT_JOB_WORKERS", "2"))
+JOB_QUEUE_LIMIT = int(os.environ.get("TREAT_JOB_QUEUE_LIMIT", "16"))
+JOB_RETENTION_SECONDS = int(os.environ.get("TREAT_JOB_RETENTION_SECONDS", "3600"))
+
+# Send every request's work through one shared scheduler that batches it
+# across concurrent requests: a batch is dispatched once it holds
+# SCHEDULER_MAX_BATCH items or SCHEDULER_MAX_WAIT_MS after its first item
+SCHEDULER_ENABLED = _env_bool("TREAT_SCHEDULER", False)
+SCHEDULER_MAX_BATCH = int(os.environ.get("TREAT_SCHEDULER_MAX_BATCH", "64"))
+SCHEDULER_MAX_WAIT_MS = float(os.environ.get("TREAT_SCHEDULER_MAX_WAIT_MS", "5"))
+
+# Shard chunks across this many worker processes, each holding its own copy of
+# the model (0 runs inference in this process). Each worker uses
+# THREADS_PER_WORKER torch threads and, with PIN_WORKERS, its own CPU cores.
+PROCESS_WORKERS = int(os.environ.get("TREAT_PROCESS_WORKERS", "0"))
+THREADS_PER_WORKER = int(os.environ.get("TREAT_THREADS_PER_WORKER", "1"))
+PIN_WORKERS = _env_bool("TREAT_PIN_WORKERS", True)
+
+# Answer (chunk, category) pairs with no lexical evidence NO without calling
+# the model; a pair needs PREFILTER_MIN_MATCHES lexicon hits to reach the model
+PREFILTER = _env_bool("TREAT_PREFILTER", False)
+PREFILTER_MIN_MATCHES = int(os.environ.get("TREAT_PREFILTER_MIN_MATCHES", "1"))
+
+# Stop evaluating a category once its final verdict can no longer change
+# (already over the confidence threshold, or unable to reach it), evaluating
+# the chunks most likely to settle it first. Gives the same triggers as the
+# exhaustive analysis.
+EARLY_EXIT = _env_bool("TREAT_EARLY_EXIT", False)
+
+# Model cascade: CASCADE_SMALL_MODEL answers every pair first and only MAYBE
+# answers, or answers whose top two label probabilities are closer than
+# CASCADE_MARGIN, are escalated to MODEL_NAME
+CASCADE = _env_bool("TREAT_CASCADE", False)
+CASCADE_SMALL_MODEL = os.environ.get("TREAT_CASCADE_SMALL_MODEL", "google/flan-t5-base")
+CASCADE_MARGIN = float(os.environ.get("TREAT_CASCADE_MARGIN", "0.3"))
+
+# Log every chunk's per-category answer and every inference batch (at DEBUG
+# level on the treat.chunks logger); can also be switched at runtime through
+# /chunk-logging
+CHUNK_LOGGING = _env_bool("TREAT_CHUNK_LOGGING", False)
+
+# Verdicts of the latest revision of each document submitted with a
+# document_id, reused for unchanged chunks of the next revision; empty keeps
+# them in memory only. Works best with TREAT_CHUNKER=content.
+DOCUMENT_STORE_PATH = os.environ.get("TREAT_DOCUMENT_STORE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "treat", "documents.sqlite3"))
+
+# Limits for streamed uploads (/upload/stream): bytes on the wire, and
+# characters of script text once decompressed and decoded
+MAX_UPLOAD_BYTES = int(os.environ.get("TREAT_MAX_UPLOAD_BYTES", str(64 * 1024 * 1024)))
+MAX_SCRIPT_CHARS = int(os.environ.get("TREAT_MAX_SCRIPT_CHARS", "10000000"))
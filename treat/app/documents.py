@@ -0,0 +1,70 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+class DocumentStore:
+    # Verdicts of the latest analysed revision of each document, keyed by the
+    # same content keys as the verdict cache. When a revised script comes in
+    # under the same document id, every chunk that is still in it is answered
+    # from here and only new or edited chunks go to the model. Unlike the
+    # verdict cache nothing is evicted, but each save replaces the document's
+    # previous revision, so the store only holds current chunks.
+    def __init__(self, path=None):
+        self.path = path
+        self._memory = {}
+        self._revisions = {}
+        self._lock = threading.Lock()
+        self._db = None
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS document_verdicts ("
+                "document_id TEXT, key TEXT, verdict TEXT, PRIMARY KEY (document_id, key))"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS documents (document_id TEXT PRIMARY KEY, revision INTEGER, updated REAL)")
+            self._db.commit()
+
+    def load(self, document_id):
+        # {key: verdict} of the document's latest revision (empty if unknown)
+        with self._lock:
+            if self._db is None:
+                return dict(self._memory.get(document_id, {}))
+            rows = self._db.execute("SELECT key, verdict FROM document_verdicts WHERE document_id = ?", (document_id,)).fetchall()
+            return {key: json.loads(verdict) for key, verdict in rows}
+
+    def save(self, document_id, verdicts):
+        # Replace the document's verdicts with those of the new revision;
+        # returns the revision number
+        with self._lock:
+            if self._db is None:
+                self._memory[document_id] = dict(verdicts)
+                revision = self._revisions[document_id] = self._revisions.get(document_id, 0) + 1
+            else:
+                row = self._db.execute("SELECT revision FROM documents WHERE document_id = ?", (document_id,)).fetchone()
+                revision = (row[0] if row else 0) + 1
+                self._db.execute("DELETE FROM document_verdicts WHERE document_id = ?", (document_id,))
+                self._db.executemany(
+                    "INSERT INTO document_verdicts (document_id, key, verdict) VALUES (?, ?, ?)",
+                    [(document_id, key, json.dumps(verdict)) for key, verdict in verdicts.items()]
+                )
+                self._db.execute("INSERT OR REPLACE INTO documents (document_id, revision, updated) VALUES (?, ?, ?)", (document_id, revision, time.time()))
+                self._db.commit()
+        logging.info(f"Stored {len(verdicts)} verdicts for revision {revision} of document {document_id}")
+        return revision
+
+    def forget(self, document_id):
+        with self._lock:
+            self._memory.pop(document_id, None)
+            self._revisions.pop(document_id, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM document_verdicts WHERE document_id = ?", (document_id,))
+                self._db.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+                self._db.commit()
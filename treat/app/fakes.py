@@ -0,0 +1,41 @@
+import zlib
+
+from app import metrics
+from app.prefilter import Prefilter
+from app.registry import ModelHandle
+from app.scoring import LABELS
+
+class KeywordModelHandle(ModelHandle):
+    # Stand-in for a real model that needs no weights, network or torch:
+    # answers from lexicon hits in the chunk, with deterministic probabilities.
+    # Useful to exercise the analysis pipeline (chunking, caching,
+    # aggregation, cascades) offline. `sharpness` controls how confident it
+    # is: low values give more MAYBE and low-margin answers.
+    def __init__(self, categories, model_name="stand-in", sharpness=1.0, backend="stand-in"):
+        super().__init__(model_name, None, None, "cpu", backend)
+        self.prefilter = Prefilter(categories)
+        self.sharpness = sharpness
+        self.calls = 0
+
+    def probabilities(self, chunk, category):
+        hits = self.prefilter.score(chunk, category) or 0
+        # Deterministic per-pair jitter so answers aren't all identical
+        jitter = (zlib.crc32(f"{self.model_name}|{category}|{chunk}".encode("utf-8")) % 1000) / 1000
+        yes = min(1.0, hits * 0.25 * self.sharpness + jitter * 0.2)
+        no = max(0.0, 1.0 - yes - 0.3 * (1 - self.sharpness) * jitter)
+        maybe = max(0.0, 1.0 - yes - no)
+        total = yes + no + maybe
+        return {"YES": yes / total, "NO": no / total, "MAYBE": maybe / total}
+
+    def classify_items(self, chunks, work_items):
+        # Same contract as model.classify; counts as one model call with a
+        # token per word
+        self.calls += len(work_items)
+        verdicts = []
+        with metrics.timed("generate"):
+            for chunk_idx, category in work_items:
+                probs = self.probabilities(chunks[chunk_idx], category)
+                verdicts.append({"label": max(LABELS, key=lambda label: probs[label]), "probs": probs})
+        metrics.count("model_calls")
+        metrics.count("tokens", sum(len(chunks[chunk_idx].split()) for chunk_idx, _ in work_items))
+        return verdicts
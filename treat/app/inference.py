@@ -0,0 +1,107 @@
+from app import config
+from app import metrics
+
+# Improved generation parameters
+GENERATION_KWARGS = {
+    "max_new_tokens": 50,
+    "temperature": 0.3,
+    "top_p": 0.9,
+    "num_beams": 4,
+    "early_stopping": True,
+    "do_sample": config.DO_SAMPLE
+}
+
+# torch is imported inside the functions that need it, so the web app can
+# start (and serve pages) before the ML stack is loaded
+
+# Prompts longer than this are truncated by the tokenizer
+MAX_INPUT_LENGTH = 512
+
+def parse_answer(response_text):
+    # Only the first word of the model's answer matters: YES, NO or MAYBE
+    response_text = response_text.strip().upper()
+    return response_text.split()[0] if response_text else "NO"
+
+def classify_sequential(handle, prompts):
+    # Run each prompt through the model on its own (batch size 1)
+    import torch
+    tokenizer, model = handle.tokenizer, handle.model
+    answers = []
+
+    for prompt in prompts:
+        with metrics.timed("tokenize"):
+            inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=MAX_INPUT_LENGTH)
+            inputs = {k: v.to(handle.device) for k, v in inputs.items()}
+        metrics.count("tokens", inputs["input_ids"].shape[-1])
+
+        with torch.no_grad(), metrics.timed("generate"):
+            outputs = model.generate(
+                **inputs,
+                **GENERATION_KWARGS,
+                pad_token_id=tokenizer.eos_token_id
+            )
+        metrics.count("model_calls")
+
+        with metrics.timed("decode"):
+            answers.append(parse_answer(tokenizer.decode(outputs[0], skip_special_tokens=True)))
+
+    return answers
+
+def plan_batches(lengths, batch_size, max_batch_tokens):
+    # Group prompt indices into batches of similar length. Each batch holds at
+    # most batch_size prompts, and batch rows * longest row (the padded size)
+    # stays within max_batch_tokens. A single prompt longer than the budget
+    # still gets a batch of its own.
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches = []
+    current = []
+    longest = 0
+
+    for idx in order:
+        new_longest = max(longest, lengths[idx])
+        if current and (len(current) >= batch_size or new_longest * (len(current) + 1) > max_batch_tokens):
+            batches.append(current)
+            current = []
+            new_longest = lengths[idx]
+        current.append(idx)
+        longest = new_longest
+
+    if current:
+        batches.append(current)
+
+    return batches
+
+def classify_batched(handle, prompts, batch_size=16, max_batch_tokens=8192):
+    # Tokenize everything once, then run length-bucketed padded batches
+    with metrics.timed("tokenize"):
+        encoded = handle.tokenizer(prompts, truncation=True, max_length=MAX_INPUT_LENGTH)["input_ids"]
+    return classify_encoded(handle, encoded, batch_size, max_batch_tokens)
+
+def classify_encoded(handle, encoded, batch_size=16, max_batch_tokens=8192):
+    # classify_batched() for prompts that are already input ids
+    import torch
+    tokenizer, model = handle.tokenizer, handle.model
+    metrics.count("tokens", sum(len(ids) for ids in encoded))
+    batches = plan_batches([len(ids) for ids in encoded], batch_size, max_batch_tokens)
+    metrics.chunk_log.debug(f"Running {len(encoded)} prompts in {len(batches)} batches")
+
+    answers = [None] * len(encoded)
+    for batch in batches:
+        with metrics.timed("tokenize"):
+            inputs = tokenizer.pad({"input_ids": [encoded[i] for i in batch]}, return_tensors="pt")
+            inputs = {k: v.to(handle.device) for k, v in inputs.items()}
+
+        with torch.no_grad(), metrics.timed("generate"):
+            outputs = model.generate(
+                **inputs,
+                **GENERATION_KWARGS,
+                pad_token_id=tokenizer.eos_token_id
+            )
+        metrics.count("model_calls")
+
+        # Map each answer back to the prompt it came from
+        with metrics.timed("decode"):
+            for idx, output in zip(batch, tokenizer.batch_decode(outputs, skip_special_tokens=True)):
+                answers[idx] = parse_answer(output)
+
+    return answers
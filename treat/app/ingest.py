@@ -0,0 +1,143 @@
+import codecs
+import queue
+import threading
+import zlib
+
+# Streaming request bodies: raw text, gzip and multipart/form-data uploads are
+# decoded block by block into text pieces, so a script never has to be held
+# in memory as one body before its analysis starts.
+
+# Bytes read from the request body at a time
+BLOCK_SIZE = 64 * 1024
+
+class UploadTooLarge(Exception):
+    # Raised when an upload goes over one of the configured size limits
+    pass
+
+def iter_body(stream, max_bytes, block_size=BLOCK_SIZE):
+    # Raw blocks of the request body, refusing bodies over max_bytes
+    total = 0
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            return
+        total += len(block)
+        if total > max_bytes:
+            raise UploadTooLarge(f"Upload is larger than {max_bytes} bytes")
+        yield block
+
+def iter_multipart_file(blocks, boundary):
+    # The contents of the first file (or, failing that, field) of a
+    # multipart/form-data body, as it arrives
+    from werkzeug.sansio.multipart import MultipartDecoder, File, Field, Data, Epilogue, NeedData
+
+    decoder = MultipartDecoder(boundary.encode("latin-1"))
+    blocks = iter(blocks)
+    # 0: before the part, 1: inside it, 2: done
+    state = 0
+    while state < 2:
+        event = decoder.next_event()
+        if isinstance(event, NeedData):
+            decoder.receive_data(next(blocks, None))
+        elif isinstance(event, (File, Field)) and state == 0:
+            state = 1
+        elif isinstance(event, Data) and state == 1:
+            if event.data:
+                yield event.data
+            if not event.more_data:
+                state = 2
+        elif isinstance(event, Epilogue):
+            return
+
+def iter_gunzip(blocks, gzipped=None):
+    # Decompress the blocks when they are gzip data: when gzipped is True, or
+    # when it is None and the data starts with the gzip magic number
+    blocks = iter(blocks)
+    first = next(blocks, b"")
+    if gzipped is None:
+        gzipped = first[:2] == b"\x1f\x8b"
+    if not gzipped:
+        if first:
+            yield first
+        yield from blocks
+        return
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    yield decompressor.decompress(first)
+    for block in blocks:
+        yield decompressor.decompress(block)
+    yield decompressor.flush()
+
+def iter_text(blocks, max_chars, encoding="utf-8"):
+    # Decode the blocks into text pieces, refusing scripts over max_chars
+    # (which also caps how far a small gzip body can expand)
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    total = 0
+    for block in blocks:
+        text = decoder.decode(block)
+        total += len(text)
+        if total > max_chars:
+            raise UploadTooLarge(f"Script is longer than {max_chars} characters")
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+def upload_pieces(stream, mimetype, mimetype_params, content_encoding, max_bytes, max_chars):
+    # Text pieces of an uploaded script: a raw text body, or the first file
+    # of a multipart/form-data body. Content-Encoding: gzip applies to the
+    # whole body, so it is undone before multipart parsing; a gzipped file
+    # inside the form is recognised by its magic number.
+    blocks = iter_body(stream, max_bytes)
+    if mimetype == "multipart/form-data":
+        if "boundary" not in mimetype_params:
+            raise ValueError("multipart/form-data upload without a boundary")
+        if content_encoding == "gzip":
+            blocks = iter_gunzip(blocks, True)
+        blocks = iter_multipart_file(blocks, mimetype_params["boundary"])
+        gzipped = None
+    else:
+        gzipped = True if content_encoding == "gzip" or mimetype in ("application/gzip", "application/x-gzip") else None
+    return iter_text(iter_gunzip(blocks, gzipped), max_chars, mimetype_params.get("charset", "utf-8"))
+
+def prefetch(iterable, depth=4):
+    # Run an iterator on a background thread, up to depth items ahead, so
+    # e.g. reading and chunking the request body overlaps with inference.
+    # Errors in the iterator are raised in the consumer.
+    items = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+
+    def put(entry):
+        # Wait for room in the queue, giving up once the consumer has stopped
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as e:
+            put((done, e))
+
+    thread = threading.Thread(target=produce, name="treat-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        # The consumer stopped early (or failed): let the producer finish
+        stop.set()
@@ -0,0 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+import uuid
+
+from app import config
+from app import metrics
+from app.model import run_analysis, AnalysisCancelled
+
+class QueueFull(Exception):
+    # Raised when too many jobs are already waiting for a worker
+    pass
+
+class Job:
+    # One script analysis running in the background
+    def __init__(self, text, document_id=None):
+        self.id = uuid.uuid4().hex
+        self.text = text
+        self.document_id = document_id
+        self.reused = None
+        self.status = "queued"
+        self.created = time.time()
+        self.finished = None
+        self.chunks_done = 0
+        self.chunks_total = None
+        self.scores = {}
+        self.triggers = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        # Every progress update, so event streams can replay what they missed
+        self.events = []
+        self._changed = threading.Condition()
+
+    def add_event(self, event):
+        with self._changed:
+            self.events.append(event)
+            self._changed.notify_all()
+
+    def wait_for_events(self, seen, timeout):
+        # Block until there are more than `seen` events or the timeout passes
+        with self._changed:
+            if len(self.events) <= seen:
+                self._changed.wait(timeout)
+            return self.events[seen:]
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "chunks_done": self.chunks_done,
+            "chunks_total": self.chunks_total,
+            "scores": self.scores,
+            "triggers": self.triggers,
+            "document_id": self.document_id,
+            "reused_verdicts": self.reused,
+            "error": self.error
+        }
+
+class JobManager:
+    # Runs analyses on a bounded pool of worker threads
+    def __init__(self, workers=None, queue_limit=None, retention_seconds=None):
+        self.queue_limit = config.JOB_QUEUE_LIMIT if queue_limit is None else queue_limit
+        self.retention_seconds = config.JOB_RETENTION_SECONDS if retention_seconds is None else retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers or config.JOB_WORKERS, thread_name_prefix="treat-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def queue_depth(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == "queued")
+
+    def submit(self, text, document_id=None):
+        # Queue a new analysis, refusing it if the queue is already full
+        with self._lock:
+            self._expire()
+            if sum(1 for job in self._jobs.values() if job.status == "queued") >= self.queue_limit:
+                raise QueueFull(f"Too many queued jobs (limit {self.queue_limit})")
+            job = Job(text, document_id)
+            self._jobs[job.id] = job
+
+        self._executor.submit(self._run, job)
+        logging.info(f"Queued job {job.id} ({len(text)} characters)")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        # Ask a job to stop; queued jobs never start, running ones stop at the next step
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        self._finish(job, "cancelled", only_from="queued")
+        return job
+
+    def _run(self, job):
+        # Status changes happen under the lock, so a cancel either finishes
+        # the job while it is still queued or is seen by the running analysis
+        with self._lock:
+            if job.cancel_event.is_set() or job.status != "queued":
+                return
+            job.status = "running"
+            text = job.text
+        job.add_event({"event": "status", "data": job.to_dict()})
+
+        def on_chunk(update):
+            job.chunks_done = update["chunks_done"]
+            job.chunks_total = update["chunks_total"]
+            job.scores = update["scores"]
+            job.add_event({"event": "chunk", "data": update})
+
+        try:
+            analysis = run_analysis(text, progress=on_chunk, cancel=job.cancel_event, document_id=job.document_id)
+            job.chunks_total = analysis["chunks"]
+            job.reused = analysis["stats"].get("document_reused")
+            job.triggers = analysis["final_triggers"] or ["None"]
+            self._finish(job, "done")
+        except AnalysisCancelled:
+            self._finish(job, "cancelled")
+        except Exception as e:
+            logging.exception(f"Job {job.id} failed")
+            metrics.count("errors")
+            job.error = str(e)
+            self._finish(job, "failed")
+
+    def _finish(self, job, status, only_from=None):
+        # Move the job to a final status, unless it is already over (or, with
+        # only_from, no longer in that status)
+        with self._lock:
+            if job.done or (only_from is not None and job.status != only_from):
+                return
+            job.status = status
+            job.finished = time.time()
+            # The text is no longer needed once the job is over
+            job.text = None
+        job.add_event({"event": status, "data": job.to_dict()})
+        logging.info(f"Job {job.id} {status}")
+
+    def _expire(self):
+        # Forget finished jobs older than the retention period (lock held by caller)
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+# Shared job manager used by the web app
+job_manager = JobManager()
@@ -0,0 +1,58 @@
+import os
+
+# Memory use of this process and related ones, for sizing deployments.
+# PSS (proportional set size) splits every shared page between the processes
+# mapping it, so the PSS of a group of processes adds up to what they really
+# use together; their RSS counts shared weights once per process.
+
+def process_memory(pid=None):
+    # {"pid", "rss_mb", "pss_mb", "shared_mb"} from /proc (Linux), or None
+    # if the process is gone or the numbers aren't available
+    pid = pid or os.getpid()
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":"):
+                    fields[parts[0][:-1]] = int(parts[1])
+    except (OSError, ValueError):
+        return None
+    return {
+        "pid": pid,
+        "rss_mb": fields.get("Rss", 0) / 1024,
+        "pss_mb": fields.get("Pss", 0) / 1024,
+        "shared_mb": (fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)) / 1024
+    }
+
+def child_pids(parent):
+    # Direct children of a process, from the parent pid in /proc/<pid>/stat
+    children = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return children
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name can contain spaces; the fields after it can't
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == parent:
+            children.append(int(entry))
+    return sorted(children)
+
+def memory_report(siblings=False):
+    # Memory of this process and its children (e.g. inference worker
+    # processes), or with siblings=True of every child of this process's
+    # parent (e.g. all the workers of a pre-fork WSGI server), plus totals
+    pids = child_pids(os.getppid()) if siblings else [os.getpid()] + child_pids(os.getpid())
+    processes = [usage for usage in map(process_memory, pids) if usage is not None]
+    return {
+        "processes": processes,
+        "total_rss_mb": sum(usage["rss_mb"] for usage in processes),
+        "total_pss_mb": sum(usage["pss_mb"] for usage in processes)
+    }
@@ -0,0 +1,133 @@
+from contextlib import contextmanager
+import threading
+import logging
+import time
+
+from app import config
+
+# Process-wide counters, per-stage timers and latency histograms for the
+# analysis hot path, exported in the Prometheus text format by /metrics.
+# Stages: model_load, chunk, tokenize, generate (every model forward or
+# generate call) and decode (turning model outputs back into labels).
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Help text for every exported metric; counters get a _total suffix
+DESCRIPTIONS = {
+    "requests": "Analysis requests received",
+    "errors": "Analysis requests that failed",
+    "chunks": "Script chunks analysed",
+    "pairs": "(chunk, category) pairs sent to the model",
+    "model_calls": "Model forward or generate calls",
+    "tokens": "Input tokens run through the model",
+    "cache_hits": "Verdicts answered from the verdict cache",
+    "cache_misses": "Verdicts the verdict cache did not have",
+    "stage_seconds": "Time spent per pipeline stage",
+    "analysis_seconds": "End-to-end time of one script analysis",
+    "request_seconds": "HTTP request latency per route"
+}
+
+_lock = threading.Lock()
+_counters = {}
+# (name, labels) -> [count per bucket..., sum, count]
+_histograms = {}
+
+# Per-chunk and per-batch log lines go to this logger at DEBUG level; they
+# are a measurable cost on long scripts, so they are off unless enabled
+chunk_log = logging.getLogger("treat.chunks")
+
+def set_chunk_logging(enabled):
+    chunk_log.setLevel(logging.DEBUG if enabled else logging.INFO)
+
+def chunk_logging_enabled():
+    return chunk_log.isEnabledFor(logging.DEBUG)
+
+set_chunk_logging(config.CHUNK_LOGGING)
+
+def count(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def observe(name, seconds, **labels):
+    # Record one duration in the histogram for name and labels
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+        for n, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[n] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+@contextmanager
+def timed(stage):
+    # Add the time spent in the with-block to the stage's histogram
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("stage_seconds", time.perf_counter() - start, stage=stage)
+
+def snapshot():
+    # Copy of the current totals: {"counters": {...}, "stages": {stage: {"calls", "seconds"}}}
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "stages": {
+                dict(labels)["stage"]: {"calls": histogram[-1], "seconds": histogram[-2]}
+                for (name, labels), histogram in _histograms.items()
+                if name == "stage_seconds"
+            }
+        }
+
+def difference(before, after):
+    # What happened between two snapshots
+    return {
+        "counters": {name: value - before["counters"].get(name, 0) for name, value in after["counters"].items()},
+        "stages": {
+            stage: {
+                "calls": totals["calls"] - before["stages"].get(stage, {}).get("calls", 0),
+                "seconds": totals["seconds"] - before["stages"].get(stage, {}).get("seconds", 0.0)
+            }
+            for stage, totals in after["stages"].items()
+        }
+    }
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+def render():
+    # Every metric in the Prometheus text exposition format
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(histogram) for key, histogram in _histograms.items()}
+
+    lines = []
+    for name in sorted(counters):
+        lines.append(f"# HELP treat_{name}_total {DESCRIPTIONS.get(name, name)}")
+        lines.append(f"# TYPE treat_{name}_total counter")
+        lines.append(f"treat_{name}_total {counters[name]}")
+
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# HELP treat_{name} {DESCRIPTIONS.get(name, name)}")
+        lines.append(f"# TYPE treat_{name} histogram")
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, observed in zip(BUCKETS, histogram):
+                lines.append(f"treat_{name}_bucket{_format_labels(labels, [('le', bound)])} {observed}")
+            lines.append(f"treat_{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram[-1]}")
+            lines.append(f"treat_{name}_sum{_format_labels(labels)} {histogram[-2]}")
+            lines.append(f"treat_{name}_count{_format_labels(labels)} {histogram[-1]}")
+    return "\n".join(lines) + "\n"
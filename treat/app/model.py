@@ -1,204 +1,501 @@
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
-import torch
 from datetime import datetime
 import traceback
+import threading
 import logging
+import time
+
+from app import config
+from app import metrics
+from app.registry import get_model
+from app.cache import VerdictCache, content_key
+from app.documents import DocumentStore
+from app.chunking import chunk_words, chunk_tokens, chunk_content, stream_chunks
+from app.ingest import prefetch
+from app.inference import GENERATION_KWARGS, MAX_INPUT_LENGTH, classify_sequential, classify_batched, classify_encoded
+from app.scoring import PRIOR_SMOOTHING, score_prompts, score_encoded, calibrate, to_verdict
+from app.categories import load_categories
+from app.prompts import encode_prompts
+from app.shared_encoder import score_chunks
+from app.scheduler import InferenceScheduler
+from app.procpool import get_process_pool
+from app.prefilter import Prefilter
+from app.cascade import cascade
+from app.aggregation import TriggerAggregator, exhaustive_plan, early_exit_plan, early_exit_priorities
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def analyze_script(script):
-    logging.info("=== Starting Analysis ===")
-    logging.info(f"Input text length: {len(script)} characters")
+# Trigger categories, loaded from the versioned categories file
+CATEGORIES_VERSION, trigger_categories = load_categories(config.CATEGORIES_PATH)
 
-    try:
-        # Load the Flan-T5 tokenizer and model
-        tokenizer = AutoTokenizer.from_pretrained("google/flan-t5-large", use_fast=True)
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        logging.info(f"Using device: {device}")
-
-        model = AutoModelForSeq2SeqLM.from_pretrained(
-            "google/flan-t5-large",
-            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-            device_map="auto"
-        )
-        logging.info("Model loaded successfully")
-
-        # Trigger categories remain the same as in your original code
-        trigger_categories = {
-            "Violence": {
-                "mapped_name": "Violence",
-                "description": (
-                    "Any act involving physical force or aggression intended to cause harm, injury, or death to a person, animal, or object. "
-                    "Includes direct physical confrontations (e.g., fights, beatings, or assaults), implied violence (e.g., very graphical threats or descriptions of injuries), "
-                    "or large-scale events like wars, riots, or violent protests."
-                )
-            },
-            "Death": {
-                "mapped_name": "Death References",
-                "description": (
-                    "Any mention, implication, or depiction of the loss of life, including direct deaths of characters, including mentions of deceased individuals, "
-                    "or abstract references to mortality (e.g., 'facing the end' or 'gone forever'). This also covers depictions of funerals, mourning, "
-                    "grieving, or any dialogue that centers around death, do not take metaphors into context that don't actually lead to death."
-                )
-            },
-            "Substance Use": {
-                "mapped_name": "Substance Use",
-                "description": (
-                    "Any explicit or implied reference to the consumption, misuse, or abuse of drugs, alcohol, or other intoxicating substances. "
-                    "rehabilitation, or substance-related paraphernalia (e.g., needles, bottles, pipes)."
-                )
-            },
-            "Gore": {
-                "mapped_name": "Gore",
-                "description": (
-                    "Extremely detailed and graphic depictions of highly severe physical injuries, mutilation, or extreme bodily harm, often accompanied by descriptions of heavy blood, exposed organs, "
-                    "or dismemberment. This includes war scenes with severe casualties, horror scenarios involving grotesque creatures, or medical procedures depicted with excessive detail."
-                )
-            },
-            "Vomit": {
-                "mapped_name": "Vomit",
-                "description": (
-                    "Any reference to the act of vomiting, whether directly described, implied, or depicted in detail. This includes sounds or visual descriptions of the act, "
-                    "mentions of nausea leading to vomiting, or its aftermath (e.g., the presence of vomit, cleaning it up, or characters reacting to it)."
-                )
-            },
-            "Sexual Content": {
-                "mapped_name": "Sexual Content",
-                "description": (
-                    "Any depiction of sexual activity, intimacy, or sexual behavior, ranging from implied scenes to explicit descriptions. "
-                    "This includes physical descriptions of characters in a sexual context, sexual dialogue, or references to sexual themes (e.g., harassment, innuendos)."
-                )
-            },
-            "Sexual Abuse": {
-               "mapped_name": "Sexual Abuse",
-               "description": (
-                  "Any form of non-consensual sexual act, behavior, or interaction, involving coercion, manipulation, or physical force. "
-                  "This includes incidents of sexual assault, molestation, exploitation, harassment, and any acts where an individual is subjected to sexual acts against their will or without their consent. "
-                  "It also covers discussions or depictions of the aftermath of such abuse, such as trauma, emotional distress, legal proceedings, or therapy. "
-                  "References to inappropriate sexual advances, groping, or any other form of sexual misconduct are also included, as well as the psychological and emotional impact on survivors. "
-                  "Scenes where individuals are placed in sexually compromising situations, even if not directly acted upon, may also fall under this category."
-               )
-            },
-            "Self-Harm": {
-                "mapped_name": "Self-Harm",
-                "description": (
-                    "Any mention or depiction of behaviors where an individual intentionally causes harm to themselves. This includes cutting, burning, or other forms of physical injury, "
-                    "as well as suicidal ideation, suicide attempts, or discussions of self-destructive thoughts and actions. References to scars, bruises, or other lasting signs of self-harm are also included."
-                )
-            },
-            "Gun Use": {
-                "mapped_name": "Gun Use",
-                "description": (
-                    "Any explicit or implied mention of firearms being handled, fired, or used in a threatening manner. This includes scenes of gun violence, references to shootings, "
-                    "gun-related accidents, or the presence of firearms in a tense or dangerous context (e.g., holstered weapons during an argument)."
-                )
-            },
-            "Animal Cruelty": {
-                "mapped_name": "Animal Cruelty",
-                "description": (
-                    "Any act of harm, abuse, or neglect toward animals, whether intentional or accidental. This includes physical abuse (e.g., hitting, injuring, or killing animals), "
-                    "mental or emotional mistreatment (e.g., starvation, isolation), and scenes where animals are subjected to pain or suffering for human entertainment or experimentation."
-                )
-            },
-            "Mental Health Issues": {
-                "mapped_name": "Mental Health Issues",
-                "description": (
-                    "Any reference to mental health struggles, disorders, or psychological distress. This includes mentions of depression, anxiety, PTSD, bipolar disorder, schizophrenia, "
-                    "or other conditions. Scenes depicting therapy sessions, psychiatric treatment, or coping mechanisms (e.g., medication, journaling) are also included. May cover subtle hints "
-                    "like a character expressing feelings of worthlessness, hopelessness, or detachment from reality."
-                )
-            }
+# Bump whenever a prompt template changes, so cached verdicts are not reused
+PROMPT_VERSION = 1
+
+def category_fingerprint(info):
+    # Changes whenever a category's name or description is edited
+    return content_key(info["mapped_name"], info["description"])
+
+def build_prompt(chunk, info):
+    # Improved prompt template
+    mapped_name = info["mapped_name"]
+    description = info["description"]
+    return f"""
+    Task: Carefully analyze this text for content related to {mapped_name}.
+    Context: {description}
+
+    Text to analyze:
+    \"{chunk}\"
+
+    Question: Based on the definition provided, does this text contain any content related to {mapped_name}?
+    Important: Consider both explicit and implicit references.
+    Response format: Answer with ONLY ONE of these exact words: YES, NO, or MAYBE
+    """
+
+# Fewest chunk tokens the longest category prompt must leave room for
+MIN_CHUNK_TOKENS = 64
+
+# Prompt overhead in tokens per tokenizer, computed once
+_prompt_overhead_cache = {}
+
+def chunk_token_budget(tokenizer):
+    # Tokens left for the chunk once the longest category prompt (and a small
+    # safety margin for tokens merging at the splice) is accounted for
+    key = id(tokenizer)
+    if key not in _prompt_overhead_cache:
+        overheads = {
+            category: len(tokenizer(build_prompt("", info))["input_ids"]) for category, info in trigger_categories.items()
         }
+        # Categories come from an editable file: refuse descriptions that
+        # leave no room for the script, naming the category to shorten
+        category = max(overheads, key=overheads.get)
+        if MAX_INPUT_LENGTH - overheads[category] - 8 < MIN_CHUNK_TOKENS:
+            raise ValueError(
+                f"The prompt for category {category} in {config.CATEGORIES_PATH} takes {overheads[category]} of "
+                f"{MAX_INPUT_LENGTH} tokens, leaving fewer than {MIN_CHUNK_TOKENS} for the script; shorten its description"
+            )
+        _prompt_overhead_cache[key] = overheads[category]
+    return MAX_INPUT_LENGTH - _prompt_overhead_cache[key] - 8
+
+def chunk_script(script, tokenizer=None, chunker=None):
+    # Split the script into Chunk(text, start, end) pieces
+    chunker = chunker or config.CHUNKER
+    if chunker == "tokens":
+        if tokenizer is not None and getattr(tokenizer, "is_fast", False):
+            return chunk_tokens(script, tokenizer, chunk_token_budget(tokenizer), config.CHUNK_OVERLAP_TOKENS)
+        logging.warning("Token chunking needs a fast tokenizer, falling back to word chunking")
+    elif chunker == "content":
+        if tokenizer is not None and getattr(tokenizer, "is_fast", False):
+            return chunk_content(script, config.CHUNK_SIZE, tokenizer, chunk_token_budget(tokenizer))
+        return chunk_content(script, config.CHUNK_SIZE)
+    elif chunker != "words":
+        raise ValueError(f"Unknown chunker: {chunker}")
+
+    # Improved chunking with smaller chunks and more overlap
+    return chunk_words(script, config.CHUNK_SIZE, config.CHUNK_OVERLAP)
+
+# Text used to measure each prompt's answer bias for calibration
+CONTENT_FREE_TEXT = "N/A"
+
+# Calibration priors per (model, engine, category), computed once
+_calibration_priors = {}
+
+def get_calibration_priors(handle, engine):
+    # Score every category on content-free text, once per model and engine
+    missing = {
+        category: info for category, info in trigger_categories.items()
+        if (handle.model_id, engine, category) not in _calibration_priors
+    }
+    if missing:
+        if engine == "shared-encoder":
+            results = score_chunks(handle, [CONTENT_FREE_TEXT], missing)
+        elif config.COMPILED_PROMPTS:
+            work_items = [(0, category) for category in missing]
+            encoded = encode_prompts(handle.tokenizer, [CONTENT_FREE_TEXT], work_items, missing, build_prompt, MAX_INPUT_LENGTH)
+            results = score_encoded(handle, encoded)
+        else:
+            results = score_prompts(handle, [build_prompt(CONTENT_FREE_TEXT, info) for info in missing.values()])
+        for category, probs in zip(missing, results):
+            _calibration_priors[(handle.model_id, engine, category)] = probs
+    return {category: _calibration_priors[(handle.model_id, engine, category)] for category in trigger_categories}
+
+def classify(handle, script_chunks, work_items, mode, decoding, engine):
+    # Answer every (chunk, category) work item with a verdict:
+    # {"label": YES/NO/MAYBE, "probs": {...} or None}
+    if mode not in ("batched", "sequential"):
+        raise ValueError(f"Unknown inference mode: {mode}")
+    if not work_items:
+        # Nothing left to ask, e.g. every pair was prefiltered
+        return []
+    metrics.count("pairs", len(work_items))
+
+    # Stand-in handles (see app.fakes) answer without a real model
+    if hasattr(handle, "classify_items"):
+        return handle.classify_items(script_chunks, work_items)
+
+    if engine == "shared-encoder":
+        # Encode each chunk once and score the requested categories against
+        # it; chunks asking for the same categories are scored together, so
+        # cached, prefiltered and retired pairs cost no decoder rows
+        if decoding != "score":
+            raise ValueError("The shared-encoder engine only supports score decoding")
+        requested = {}
+        for chunk_idx, category in work_items:
+            requested.setdefault(chunk_idx, set()).add(category)
+        groups = {}
+        for chunk_idx in sorted(requested):
+            categories = tuple(category for category in trigger_categories if category in requested[chunk_idx])
+            groups.setdefault(categories, []).append(chunk_idx)
+
+        by_item = {}
+        for categories, chunk_ids in groups.items():
+            scored = score_chunks(
+                handle,
+                [script_chunks[i] for i in chunk_ids],
+                {category: trigger_categories[category] for category in categories},
+                config.SHARED_ENCODER_CHUNKS
+            )
+            for row, chunk_idx in enumerate(chunk_ids):
+                for col, category in enumerate(categories):
+                    by_item[(chunk_idx, category)] = scored[row * len(categories) + col]
+        results = [by_item[item] for item in work_items]
+    elif engine == "per-category":
+        # Compiled prompts splice each chunk's token ids, tokenized once, into
+        # pre-tokenized category templates; sequential generation keeps strings
+        compiled = config.COMPILED_PROMPTS and not (decoding == "generate" and mode == "sequential")
+        if compiled:
+            encoded = encode_prompts(handle.tokenizer, script_chunks, work_items, trigger_categories, build_prompt, MAX_INPUT_LENGTH)
+        else:
+            prompts = [build_prompt(script_chunks[chunk_idx], trigger_categories[category]) for chunk_idx, category in work_items]
+
+        if decoding == "generate":
+            # Free-form generation, keeping only the first word of the answer
+            if compiled:
+                answers = classify_encoded(handle, encoded, config.BATCH_SIZE, config.MAX_BATCH_TOKENS)
+            elif mode == "batched":
+                answers = classify_batched(handle, prompts, config.BATCH_SIZE, config.MAX_BATCH_TOKENS)
+            else:
+                answers = classify_sequential(handle, prompts)
+            return [{"label": answer, "probs": None} for answer in answers]
+        if decoding != "score":
+            raise ValueError(f"Unknown decoding mode: {decoding}")
+
+        # One encoder pass and one decoder step, reading the label logits directly
+        batch_size = config.BATCH_SIZE if mode == "batched" else 1
+        if compiled:
+            results = score_encoded(handle, encoded, batch_size, config.MAX_BATCH_TOKENS)
+        else:
+            results = score_prompts(handle, prompts, batch_size, config.MAX_BATCH_TOKENS)
+    else:
+        raise ValueError(f"Unknown prompt engine: {engine}")
+
+    if config.CALIBRATE:
+        priors = get_calibration_priors(handle, engine)
+        results = [calibrate(probs, priors[category]) for (_, category), probs in zip(work_items, results)]
+    return [to_verdict(probs) for probs in results]
+
+# Process-wide verdict cache, created on first use
+_verdict_cache = None
+_verdict_cache_lock = threading.Lock()
+
+def get_verdict_cache():
+    global _verdict_cache
+    with _verdict_cache_lock:
+        if _verdict_cache is None:
+            _verdict_cache = VerdictCache(config.CACHE_PATH, config.CACHE_MEMORY_ENTRIES, config.CACHE_DISK_ENTRIES)
+            # Purge verdicts computed with category definitions that have since changed
+            _verdict_cache.invalidate({category: category_fingerprint(info) for category, info in trigger_categories.items()})
+        return _verdict_cache
+
+def verdict_key(handle, chunk, category, decoding, engine, small_handle=None):
+    # Everything that can change the answer for this (chunk, category) pair
+    params = {"decoding": decoding, "engine": engine}
+    if decoding == "score":
+        params["calibrate"] = {"smoothing": PRIOR_SMOOTHING} if config.CALIBRATE else False
+    else:
+        params["generation"] = GENERATION_KWARGS
+    if engine == "per-category":
+        # Splicing token ids can tokenize the chunk's edges slightly differently
+        params["compiled_prompts"] = config.COMPILED_PROMPTS
+    if small_handle is not None:
+        params["cascade"] = {"small": small_handle.model_id, "margin": config.CASCADE_MARGIN}
+    return content_key(chunk, category, category_fingerprint(trigger_categories[category]), handle.model_id, PROMPT_VERSION, params)
+
+# Per-document verdicts of the latest revision, created on first use
+_document_store = None
+_document_store_lock = threading.Lock()
+
+def get_document_store():
+    global _document_store
+    with _document_store_lock:
+        if _document_store is None:
+            _document_store = DocumentStore(config.DOCUMENT_STORE_PATH)
+        return _document_store
+
+# Cross-request inference scheduler, created on first use
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = InferenceScheduler(classify, config.SCHEDULER_MAX_BATCH, config.SCHEDULER_MAX_WAIT_MS)
+        return _scheduler
+
+def dispatch(handle, chunks, work_items, mode, decoding, engine):
+    # Run work items directly, sharded across the worker processes, or batched
+    # with other requests' work through the shared scheduler
+    if config.PROCESS_WORKERS > 0 and not hasattr(handle, "classify_items"):
+        return get_process_pool(handle.model_name, handle.backend).classify(chunks, work_items, decoding, engine)
+    if config.SCHEDULER_ENABLED:
+        return get_scheduler().classify(handle, chunks, work_items, decoding, engine)
+    return classify(handle, chunks, work_items, mode, decoding, engine)
+
+def run_model(handle, chunks, work_items, mode, decoding, engine, small_handle=None, stats=None):
+    # Answer work items with the model, or with the small model first and
+    # the large one only for the answers the small model is unsure about
+    if not work_items:
+        return []
+    if small_handle is None:
+        return dispatch(handle, chunks, work_items, mode, decoding, engine)
+    return cascade(
+        lambda items: dispatch(small_handle, chunks, items, mode, decoding, engine),
+        lambda items: dispatch(handle, chunks, items, mode, decoding, engine),
+        work_items,
+        config.CASCADE_MARGIN,
+        stats
+    )
+
+def classify_cached(handle, chunks, work_items, mode, decoding, engine, small_handle=None, stats=None):
+    # run_model(), answering from the verdict cache where possible
+    if not config.CACHE_ENABLED:
+        return run_model(handle, chunks, work_items, mode, decoding, engine, small_handle, stats)
+
+    cache = get_verdict_cache()
+    keys = [verdict_key(handle, chunks[chunk_idx], category, decoding, engine, small_handle) for chunk_idx, category in work_items]
+    found = cache.get_many(keys)
+    missing = [n for n, key in enumerate(keys) if key not in found]
+    metrics.count("cache_hits", len(work_items) - len(missing))
+    metrics.count("cache_misses", len(missing))
+    metrics.chunk_log.debug(f"Verdict cache: {len(work_items) - len(missing)} hits, {len(missing)} misses")
+
+    if missing:
+        fresh = run_model(handle, chunks, [work_items[n] for n in missing], mode, decoding, engine, small_handle, stats)
+        entries = []
+        for n, verdict in zip(missing, fresh):
+            category = work_items[n][1]
+            found[keys[n]] = verdict
+            entries.append((keys[n], category, category_fingerprint(trigger_categories[category]), verdict))
+        cache.put_many(entries)
+
+    return [found[key] for key in keys]
+
+# Verdict for pairs the prefilter answers without the model
+PREFILTERED_VERDICT = {"label": "NO", "probs": None}
 
-        # Improved chunking with smaller chunks and more overlap
-        chunk_size = 1000
-        overlap = 20
-        script_chunks = []
-        
-        # Improved chunking to avoid splitting mid-sentence
-        words = script.split()
-        current_chunk = []
-        current_length = 0
-        
-        for word in words:
-            current_chunk.append(word)
-            current_length += len(word) + 1
-            
-            if current_length >= chunk_size:
-                script_chunks.append(" ".join(current_chunk))
-                # Keep last few words for overlap
-                current_chunk = current_chunk[-int(len(current_chunk) * (overlap/chunk_size)):]
-                current_length = sum(len(word) + 1 for word in current_chunk)
-        
-        if current_chunk:
-            script_chunks.append(" ".join(current_chunk))
-        
-        logging.info(f"Split into {len(script_chunks)} chunks with {overlap} character overlap")
-
-        identified_triggers = {}
-        chunk_triggers = {i: [] for i in range(len(script_chunks))}  # Track triggers per chunk
-
-        for chunk_idx, chunk in enumerate(script_chunks, 1):
-            logging.info(f"\n--- Processing Chunk {chunk_idx}/{len(script_chunks)} ---")
-            chunk_length = len(chunk)
-            logging.info(f"Chunk length: {chunk_length} characters")
-            
-            for category, info in trigger_categories.items():
-                mapped_name = info["mapped_name"]
-                description = info["description"]
-
-                # Improved prompt template
-                prompt = f"""
-                Task: Carefully analyze this text for content related to {mapped_name}.
-                Context: {description}
-                
-                Text to analyze:
-                \"{chunk}\"
-                
-                Question: Based on the definition provided, does this text contain any content related to {mapped_name}?
-                Important: Consider both explicit and implicit references.
-                Response format: Answer with ONLY ONE of these exact words: YES, NO, or MAYBE
-                """
-
-                inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512)
-                inputs = {k: v.to(device) for k, v in inputs.items()}
-
-                # Improved generation parameters
-                with torch.no_grad():
-                    outputs = model.generate(
-                        **inputs,
-                        max_new_tokens=50,
-                        temperature=0.3,
-                        top_p=0.9,
-                        num_beams=4,
-                        early_stopping=True,
-                        pad_token_id=tokenizer.eos_token_id,
-                        do_sample=True 
-                    )
-
-                response_text = tokenizer.decode(outputs[0], skip_special_tokens=True).strip().upper()
-                first_word = response_text.split()[0] if response_text else "NO"
-                
-                logging.info(f"Category: {mapped_name}, Response: {first_word}")
-
-                if first_word == "YES":
-                    identified_triggers[mapped_name] = identified_triggers.get(mapped_name, 0) + 1
-                    chunk_triggers[chunk_idx-1].append(mapped_name)
-                elif first_word == "MAYBE":
-                    identified_triggers[mapped_name] = identified_triggers.get(mapped_name, 0) + 0.5
-                    chunk_triggers[chunk_idx-1].append(f"{mapped_name} (Maybe)")
-
-        # Improved trigger detection logic
-        final_triggers = []
-        confidence_threshold = 0.6
-        
-        for mapped_name, count in identified_triggers.items():
-            confidence_score = count / len(script_chunks)
-            logging.info(f"Trigger: {mapped_name}, Confidence Score: {confidence_score:.2f}")
-            
-            if confidence_score > confidence_threshold:
-                final_triggers.append(mapped_name)
+# Lexical prefilter, compiled on first use
+_prefilter = None
+
+def get_prefilter():
+    global _prefilter
+    if _prefilter is None:
+        _prefilter = Prefilter(trigger_categories, config.PREFILTER_MIN_MATCHES)
+    return _prefilter
+
+class AnalysisCancelled(Exception):
+    # Raised inside run_analysis when its cancel event is set
+    pass
+
+def answer_step(handle, unique_chunks, step_items, mode, decoding, engine, small_handle, stats, prefilter=None, previous=None, document_verdicts=None):
+    # Verdicts for one step's (distinct chunk, category) pairs: NO for pairs
+    # without any lexical evidence, the document's previous verdicts where it
+    # has them, and the model (through the verdict cache) for the rest
+    model_items = step_items
+    if prefilter is not None:
+        model_items = [(unique_idx, category) for unique_idx, category in step_items if prefilter.should_send(unique_chunks[unique_idx], category)]
+        stats["prefiltered"] = stats.get("prefiltered", 0) + len(step_items) - len(model_items)
+
+    step_verdicts = dict.fromkeys(step_items, PREFILTERED_VERDICT)
+    if previous is not None:
+        # Answer pairs the document's previous revision already had
+        keys = {item: verdict_key(handle, unique_chunks[item[0]], item[1], decoding, engine, small_handle) for item in model_items}
+        for item in model_items:
+            if keys[item] in previous:
+                step_verdicts[item] = previous[keys[item]]
+        stats["document_reused"] = stats.get("document_reused", 0) + sum(1 for item in model_items if keys[item] in previous)
+        model_items = [item for item in model_items if keys[item] not in previous]
+        stats["document_inferred"] = stats.get("document_inferred", 0) + len(model_items)
+    if model_items:
+        step_verdicts.update(zip(model_items, classify_cached(handle, unique_chunks, model_items, mode, decoding, engine, small_handle, stats)))
+    if previous is not None:
+        document_verdicts.update((keys[item], verdict) for item, verdict in step_verdicts.items() if item in keys)
+    return step_verdicts
+
+def analysis_step_size():
+    # Distinct chunks per step
+    step = max(1, config.CHUNKS_PER_STEP)
+    if config.PROCESS_WORKERS > 0:
+        # Give every worker process at least one chunk per step
+        step = max(step, config.PROCESS_WORKERS)
+    return step
+
+def finish_analysis(handle, small_handle, aggregator, chunks, unique_count, stats, start):
+    # Log the run's savings and build the result dict of an analysis
+    if config.PREFILTER:
+        logging.info(f"Prefilter answered {stats.get('prefiltered', 0)} of {unique_count * len(trigger_categories)} pairs without the model")
+    if small_handle is not None and stats.get("cascade_pairs"):
+        stats["cascade_escalation_rate"] = stats["cascade_escalated"] / stats["cascade_pairs"]
+        logging.info(f"Cascade escalated {stats['cascade_escalated']} of {stats['cascade_pairs']} pairs to {handle.model_name}")
+
+    metrics.observe("analysis_seconds", time.perf_counter() - start)
+
+    return {
+        "final_triggers": aggregator.final_triggers(),
+        "identified_triggers": aggregator.identified_triggers,
+        "chunk_triggers": aggregator.chunk_triggers,
+        "chunk_labels": aggregator.chunk_labels,
+        "category_scores": aggregator.category_scores(),
+        "chunks": len(chunks),
+        "prefiltered": stats.get("prefiltered", 0),
+        "chunk_offsets": [(chunk.start, chunk.end) for chunk in chunks],
+        "stats": stats
+    }
+
+def run_analysis(script, handle=None, mode=None, decoding=None, engine=None, progress=None, cancel=None, small_handle=None, document_id=None):
+    # Full analysis of a script; returns the final triggers plus the
+    # per-category and per-chunk details behind them. progress, if given, is
+    # called with a dict after every chunk; cancel is a threading.Event that
+    # stops the analysis between steps. small_handle (or CASCADE) puts a small
+    # model in front of handle, escalating only its uncertain answers. With a
+    # document_id, verdicts of the document's previous revision are reused
+    # for every chunk that is unchanged and only the rest is re-inferred.
+    start = time.perf_counter()
+    handle = handle or get_model()
+    if small_handle is None and config.CASCADE:
+        small_handle = get_model(config.CASCADE_SMALL_MODEL, handle.backend)
+    stats = {}
+    logging.info(f"Using model {handle.model_name} ({handle.backend}) on device: {handle.device}")
+
+    with metrics.timed("chunk"):
+        chunks = chunk_script(script, handle.tokenizer)
+    script_chunks = [chunk.text for chunk in chunks]
+    metrics.count("chunks", len(script_chunks))
+    logging.info(f"Split into {len(script_chunks)} chunks")
+
+    # Collapse duplicate chunks so each distinct text is only analysed once
+    unique_chunks = []
+    unique_index = {}
+    chunk_to_unique = []
+    for chunk in script_chunks:
+        if chunk not in unique_index:
+            unique_index[chunk] = len(unique_chunks)
+            unique_chunks.append(chunk)
+        chunk_to_unique.append(unique_index[chunk])
+
+    mode = mode or config.INFERENCE_MODE
+    decoding = decoding or config.DECODING
+    engine = engine or config.PROMPT_ENGINE
+    logging.info(f"Analysing {len(unique_chunks)} distinct chunks with the {engine} engine in {mode} mode with {decoding} decoding")
+
+    aggregator = TriggerAggregator(trigger_categories, chunk_to_unique)
+    previous = get_document_store().load(document_id) if document_id is not None else None
+    document_verdicts = {}
+    prefilter = get_prefilter() if config.PREFILTER else None
+
+    # Work through the distinct chunks a few at a time, so progress can be
+    # reported and the analysis cancelled between steps
+    step = analysis_step_size()
+    if config.EARLY_EXIT and unique_chunks:
+        # Stop asking about a category once its outcome can no longer change
+        priorities = early_exit_priorities(unique_chunks, aggregator, prefilter or get_prefilter())
+        plan = early_exit_plan(aggregator, priorities, step)
+    else:
+        plan = exhaustive_plan(len(unique_chunks), trigger_categories, step)
+
+    for step_items in plan:
+        if cancel is not None and cancel.is_set():
+            raise AnalysisCancelled(f"Analysis cancelled after {aggregator.chunks_done}/{len(script_chunks)} chunks")
+
+        step_verdicts = answer_step(handle, unique_chunks, step_items, mode, decoding, engine, small_handle, stats, prefilter, previous, document_verdicts)
+
+        # Expand back to every chunk of the script, duplicates included
+        for unique_idx, category in step_items:
+            aggregator.record(unique_idx, category, step_verdicts[(unique_idx, category)])
+        if config.EARLY_EXIT:
+            aggregator.retire_decided()
+
+        for chunk_idx in aggregator.completed_chunks():
+            if progress is not None:
+                progress(aggregator.progress(chunk_idx))
+
+    if config.EARLY_EXIT:
+        evaluated = sum(aggregator.evaluated.values())
+        logging.info(f"Early exit evaluated {evaluated} of {len(script_chunks) * len(trigger_categories)} chunk/category pairs")
+
+    if previous is not None:
+        stats["document_revision"] = get_document_store().save(document_id, document_verdicts)
+        logging.info(f"Document {document_id}: reused {stats.get('document_reused', 0)} verdicts, re-inferred {stats.get('document_inferred', 0)}")
+
+    return finish_analysis(handle, small_handle, aggregator, chunks, len(unique_chunks), stats, start)
+
+def run_analysis_stream(pieces, handle=None, mode=None, decoding=None, engine=None, small_handle=None):
+    # run_analysis() for a script that arrives as an iterable of text pieces
+    # (e.g. a request body being uploaded): chunks are analysed as soon as
+    # they are complete, while a background thread keeps reading and
+    # chunking the rest. Early exit needs the chunk count up front, so every
+    # category is evaluated for every chunk.
+    start = time.perf_counter()
+    handle = handle or get_model()
+    if small_handle is None and config.CASCADE:
+        small_handle = get_model(config.CASCADE_SMALL_MODEL, handle.backend)
+    stats = {}
+    mode = mode or config.INFERENCE_MODE
+    decoding = decoding or config.DECODING
+    engine = engine or config.PROMPT_ENGINE
+    prefilter = get_prefilter() if config.PREFILTER else None
+    step = analysis_step_size()
+    logging.info(f"Streaming analysis with model {handle.model_name} ({handle.backend}) on device: {handle.device}")
+
+    chunks = []
+    unique_chunks = []
+    unique_index = {}
+    chunk_to_unique = []
+    pending = []
+    verdicts = {}
+
+    def answer(unique_ids):
+        step_items = [(unique_idx, category) for unique_idx in unique_ids for category in trigger_categories]
+        verdicts.update(answer_step(handle, unique_chunks, step_items, mode, decoding, engine, small_handle, stats, prefilter))
+
+    # Read ahead by about a step's worth of chunks while the model works
+    stream = stream_chunks(pieces, lambda text: chunk_script(text, handle.tokenizer), max(4 * config.CHUNK_SIZE, 8192))
+    for chunk in prefetch(stream, depth=2 * step):
+        chunks.append(chunk)
+        if chunk.text not in unique_index:
+            unique_index[chunk.text] = len(unique_chunks)
+            unique_chunks.append(chunk.text)
+            pending.append(unique_index[chunk.text])
+        chunk_to_unique.append(unique_index[chunk.text])
+        if len(pending) >= step:
+            answer(pending)
+            pending = []
+    if pending:
+        answer(pending)
+
+    metrics.count("chunks", len(chunks))
+    logging.info(f"Streamed {len(chunks)} chunks ({len(unique_chunks)} distinct)")
+
+    aggregator = TriggerAggregator(trigger_categories, chunk_to_unique)
+    for unique_idx, category in sorted(verdicts, key=lambda item: item[0]):
+        aggregator.record(unique_idx, category, verdicts[(unique_idx, category)])
+    return finish_analysis(handle, small_handle, aggregator, chunks, len(unique_chunks), stats, start)
+
+def analyze_script(script, handle=None, mode=None, decoding=None, engine=None, document_id=None):
+    logging.info("=== Starting Analysis ===")
+
+    try:
+        logging.info(f"Input text length: {len(script)} characters")
+        final_triggers = run_analysis(script, handle, mode, decoding, engine, document_id=document_id)["final_triggers"]
 
         if not final_triggers:
             logging.info("No triggers detected")
@@ -210,21 +507,34 @@ def analyze_script(script):
     except Exception as e:
         logging.error(f"ERROR OCCURRED: {str(e)}")
         traceback.print_exc()
+        metrics.count("errors")
         return {"error": str(e)}
 
-def get_detailed_analysis(script):
+def get_detailed_analysis(script, handle=None):
     logging.info("=== Starting Detailed Analysis ===")
-    triggers = analyze_script(script)
+
+    try:
+        handle = handle or get_model()
+        analysis = run_analysis(script, handle)
+        triggers = analysis["final_triggers"] or ["None"]
+    except Exception as e:
+        logging.error(f"ERROR OCCURRED: {str(e)}")
+        traceback.print_exc()
+        analysis = {"category_scores": {}}
+        triggers = {"error": str(e)}
     
     result = {
         "detected_triggers": triggers if isinstance(triggers, list) else ["None"],
         "confidence": "High - Content detected" if isinstance(triggers, list) and triggers != ["None"] else "High - No concerning content detected",
-        "model": "google/flan-t5-base",
+        "category_scores": analysis["category_scores"],
+        # The configured model when it could not be loaded
+        "model": handle.model_name if handle is not None else config.MODEL_NAME,
+        "backend": handle.backend if handle is not None else config.BACKEND,
         "analysis_timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "device_used": "cuda" if torch.cuda.is_available() else "cpu",
-        "chunk_size": 250,
-        "overlap": 50
+        "device_used": handle.device if handle is not None else None,
+        "chunker": config.CHUNKER,
+        "categories_version": CATEGORIES_VERSION
     }
 
     logging.info(f"Final Result Dictionary: {result}")
-    return result
\ No newline at end of file
+    return result
@@ -0,0 +1,108 @@
+import re
+
+# Cheap lexical stage in front of the model. Each category gets a compiled
+# pattern of stems; a (chunk, category) pair with no match is answered NO
+# without calling the model. Stems match any word that starts with them, so
+# "shoot" also covers "shooting" and "shootout".
+LEXICONS = {
+    "Violence": [
+        "fight", "punch", "kick", "beat", "assault", "attack", "stab", "slash", "strangl", "chok", "murder", "kill",
+        "hit", "slap", "brawl", "riot", "war", "battle", "bomb", "explo", "threat", "hostage", "tortur", "violen",
+        "wound", "injur", "bruis", "weapon", "knife", "blade", "sword", "axe", "blood", "brutal"
+    ],
+    "Death": [
+        "dead", "death", "die", "dies", "died", "dying", "kill", "murder", "corpse", "body", "bodies", "funeral",
+        "grave", "burial", "buried", "coffin", "casket", "mourn", "griev", "grief", "widow", "orphan", "suicid",
+        "passed away", "lifeless", "perish", "fatal", "deceas", "obituar", "succumb", "gone forever", "the end"
+    ],
+    "Substance Use": [
+        "drug", "drunk", "alcohol", "beer", "wine", "whisk", "vodka", "liquor", "booze", "bottle", "drink", "shot",
+        "smok", "cigar", "joint", "weed", "marijuana", "cannabis", "cocaine", "coke", "heroin", "meth", "crack",
+        "pill", "opioid", "overdos", "inject", "needle", "syringe", "snort", "high", "stoned", "wasted", "rehab",
+        "withdrawal", "addict", "pipe", "hangover", "intoxica", "substance"
+    ],
+    "Gore": [
+        "gore", "gory", "blood", "bleed", "guts", "entrail", "intestin", "organ", "dismember", "decapitat",
+        "mutilat", "sever", "flesh", "bone", "skull", "brain", "splatter", "disembowel", "viscera", "carcass",
+        "corpse", "wound", "gash", "torn", "rip", "maim", "grotesque", "mangled"
+    ],
+    "Vomit": [
+        "vomit", "puk", "throw up", "threw up", "throwing up", "barf", "retch", "gag", "heav", "nause", "queas",
+        "sick to", "bile", "regurgitat", "spew", "hurl"
+    ],
+    "Sexual Content": [
+        "sex", "nude", "naked", "undress", "strip", "kiss", "bed", "sleep with", "slept with", "make love",
+        "making love", "intima", "erotic", "seduc", "lust", "arous", "moan", "orgasm", "breast", "lingerie",
+        "affair", "hookup", "hook up", "innuendo", "flirt", "caress", "grope"
+    ],
+    "Sexual Abuse": [
+        "rape", "molest", "sexual assault", "sexually assault", "abus", "grope", "groping", "harass", "consent",
+        "coerc", "forced", "against her will", "against his will", "against their will", "exploit", "traffick",
+        "incest", "predator", "pedophil", "violat", "unwanted", "advances", "misconduct", "survivor", "trauma"
+    ],
+    "Self-Harm": [
+        "self-harm", "self harm", "cut herself", "cut himself", "cut themselves", "cutting", "razor", "scar",
+        "burn herself", "burn himself", "suicid", "kill myself", "kill herself", "kill himself", "end it all",
+        "end my life", "overdos", "slit", "wrist", "hang herself", "hang himself", "noose", "jump off",
+        "self-destruct", "self destruct", "bruis", "hurt myself", "hurt herself", "hurt himself"
+    ],
+    "Gun Use": [
+        "gun", "pistol", "revolver", "rifle", "shotgun", "firearm", "handgun", "weapon", "shoot", "shot", "fire",
+        "firing", "bullet", "ammo", "ammunition", "trigger", "holster", "barrel", "magazine", "cartridge",
+        "sniper", "glock", "ak-47", "assault rifle", "muzzle", "gunfire", "gunshot", "armed"
+    ],
+    "Animal Cruelty": [
+        "animal", "dog", "puppy", "cat", "kitten", "horse", "pet", "bird", "cow", "pig", "rabbit", "mouse",
+        "mice", "rat", "creature", "beast", "fox", "deer", "wolf", "monkey", "chimp", "livestock", "cattle",
+        "poach", "hunt", "trap", "cage", "starv", "neglect", "abus", "kick", "whimper", "yelp", "slaughter",
+        "experiment"
+    ],
+    "Mental Health Issues": [
+        "depress", "anxi", "panic", "ptsd", "trauma", "bipolar", "schizo", "psych", "therap", "counsel",
+        "mental", "disorder", "medication", "antidepress", "hallucinat", "delusion", "paranoi", "suicid",
+        "worthless", "hopeless", "numb", "detach", "breakdown", "insomnia", "obsess", "compuls", "manic",
+        "lonel", "despair", "struggl", "cope", "coping", "journal", "flashback"
+    ]
+}
+
+# "(e.g., needles, bottles, pipes)" style example lists in the descriptions
+EXAMPLES = re.compile(r"\(e\.g\.,?\s*([^)]*)\)", re.IGNORECASE)
+
+def description_terms(description):
+    # Pull the example terms out of a category description
+    terms = []
+    for examples in EXAMPLES.findall(description):
+        for term in re.split(r",|\bor\b|\band\b", examples):
+            term = term.strip(" .'\"").lower()
+            # Long descriptive phrases never occur verbatim; keep short terms only
+            if len(term) > 2 and len(term.split()) <= 2:
+                terms.append(term)
+    return terms
+
+def compile_pattern(terms):
+    # One alternation per category, longest stems first, matching word prefixes
+    stems = sorted({term.lower() for term in terms if term}, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(re.escape(stem) for stem in stems) + r")", re.IGNORECASE)
+
+class Prefilter:
+    # Decides which (chunk, category) pairs are worth sending to the model
+    def __init__(self, categories, min_matches=1):
+        self.min_matches = min_matches
+        self.patterns = {}
+        for category, info in categories.items():
+            terms = LEXICONS.get(category, []) + description_terms(info["description"])
+            # Categories without any terms are always sent to the model
+            if terms:
+                self.patterns[category] = compile_pattern(terms)
+
+    def score(self, chunk, category):
+        # Number of lexicon hits in the chunk, or None when the category has no lexicon
+        pattern = self.patterns.get(category)
+        if pattern is None:
+            return None
+        return sum(1 for _ in pattern.finditer(chunk))
+
+    def should_send(self, chunk, category):
+        # True to send the pair to the model, False to answer NO straight away
+        score = self.score(chunk, category)
+        return score is None or score >= self.min_matches
@@ -0,0 +1,111 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import logging
+import os
+import threading
+
+from app import config
+
+# State of the current worker process, set up by _init_worker
+_worker = {}
+
+def _cpu_sets(workers, threads_per_worker):
+    # Split the CPUs this process may run on into one set per worker,
+    # wrapping around when there are more threads than CPUs
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    return [
+        [cpus[(worker * threads_per_worker + thread) % len(cpus)] for thread in range(threads_per_worker)]
+        for worker in range(workers)
+    ]
+
+def _init_worker(model_name, backend, threads_per_worker, cpu_sets, counter, pin):
+    import torch
+    from app.registry import get_model
+
+    # Workers run inference themselves: never hand work back to a pool or scheduler
+    config.PROCESS_WORKERS = 0
+    config.SCHEDULER_ENABLED = False
+
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+
+    if pin and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpu_sets[index % len(cpu_sets)])
+    torch.set_num_threads(threads_per_worker)
+    torch.set_num_interop_threads(1)
+
+    _worker["handle"] = get_model(model_name, backend)
+    logging.info(f"Inference worker {index} (pid {os.getpid()}) ready with {threads_per_worker} threads")
+
+def _classify_shard(chunks, work_items, decoding, engine):
+    from app.model import classify
+    return classify(_worker["handle"], chunks, work_items, "batched", decoding, engine)
+
+class ProcessPool:
+    # Worker processes that each hold one copy of the model and a fixed
+    # number of torch threads, optionally pinned to their own cores
+    def __init__(self, model_name, backend, workers, threads_per_worker, pin=True):
+        self.model_name = model_name
+        self.backend = backend
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        context = multiprocessing.get_context("spawn")
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(model_name, backend, threads_per_worker, _cpu_sets(workers, threads_per_worker), context.Value("i", 0), pin)
+        )
+
+    def classify(self, chunks, work_items, decoding, engine):
+        # Shard the work by chunk across the workers and merge the verdicts
+        # back in the original order
+        if not work_items:
+            return []
+        by_chunk = {}
+        for position, (chunk_idx, category) in enumerate(work_items):
+            by_chunk.setdefault(chunk_idx, []).append((position, category))
+        chunk_ids = list(by_chunk)
+        shard_count = min(self.workers, len(chunk_ids)) or 1
+
+        futures = []
+        for shard in range(shard_count):
+            shard_ids = chunk_ids[shard::shard_count]
+            shard_chunks = [chunks[chunk_idx] for chunk_idx in shard_ids]
+            positions = [position for chunk_idx in shard_ids for position, _ in by_chunk[chunk_idx]]
+            shard_items = [(local_idx, category) for local_idx, chunk_idx in enumerate(shard_ids) for _, category in by_chunk[chunk_idx]]
+            futures.append((positions, self._executor.submit(_classify_shard, shard_chunks, shard_items, decoding, engine)))
+
+        verdicts = [None] * len(work_items)
+        for positions, future in futures:
+            for position, verdict in zip(positions, future.result()):
+                verdicts[position] = verdict
+        return verdicts
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+# Process pools used when PROCESS_WORKERS > 0, one per (model, backend) so a
+# cascade's small and large models each keep their own workers; created on first use
+_pools = {}
+_pool_lock = threading.Lock()
+
+def get_process_pool(model_name=None, backend=None):
+    model_name = model_name or config.MODEL_NAME
+    backend = backend or config.BACKEND
+    with _pool_lock:
+        pool = _pools.get((model_name, backend))
+        if pool is not None and (pool.workers, pool.threads_per_worker) != (config.PROCESS_WORKERS, config.THREADS_PER_WORKER):
+            # The configuration changed (e.g. between benchmark runs): start over
+            pool.shutdown()
+            pool = None
+        if pool is None:
+            pool = _pools[(model_name, backend)] = ProcessPool(model_name, backend, config.PROCESS_WORKERS, config.THREADS_PER_WORKER, config.PIN_WORKERS)
+        return pool
+
+def shutdown_process_pool():
+    with _pool_lock:
+        for pool in _pools.values():
+            pool.shutdown()
+        _pools.clear()
@@ -0,0 +1,42 @@
+from app import metrics
+
+# Compiled per-category prompts: the template text before and after the chunk
+# is tokenized once per tokenizer and category, and each chunk is tokenized
+# once however many categories ask about it. Its ids are spliced in between,
+# so a step with N chunks and C categories tokenizes N texts, not N x C
+# prompts that repeat the same category descriptions.
+
+# Stands in for the chunk when a template is split around it
+CHUNK_MARKER = "\x00chunk\x00"
+
+# Prefix and suffix ids per (tokenizer, category definition), compiled once.
+# A changed description is a new key, so edits never reuse a stale template.
+_compiled_cache = {}
+
+def compile_template(tokenizer, info, build_prompt):
+    # (prefix ids, suffix ids) of build_prompt's template for one category
+    key = (id(tokenizer), info["mapped_name"], info["description"])
+    if key not in _compiled_cache:
+        prefix, suffix = build_prompt(CHUNK_MARKER, info).split(CHUNK_MARKER)
+        _compiled_cache[key] = (
+            tokenizer(prefix, add_special_tokens=False)["input_ids"],
+            tokenizer(suffix, add_special_tokens=False)["input_ids"]
+        )
+    return _compiled_cache[key]
+
+def encode_prompts(tokenizer, chunks, work_items, categories, build_prompt, max_length):
+    # Input ids for every (chunk, category) work item. When a prompt is too
+    # long, the chunk is truncated rather than the question after it.
+    with metrics.timed("tokenize"):
+        chunk_ids = sorted({chunk_idx for chunk_idx, _ in work_items})
+        encoded = dict(zip(chunk_ids, tokenizer([chunks[i] for i in chunk_ids], add_special_tokens=False)["input_ids"]))
+        # T5 tokenizers end every input with EOS and add nothing else. Append it
+        # directly: not every tokenizer class has build_inputs_with_special_tokens.
+        eos = [tokenizer.eos_token_id] if tokenizer.eos_token_id is not None else []
+
+        prompts = []
+        for chunk_idx, category in work_items:
+            prefix, suffix = compile_template(tokenizer, categories[category], build_prompt)
+            room = max(0, max_length - len(eos) - len(prefix) - len(suffix))
+            prompts.append(prefix + encoded[chunk_idx][:room] + suffix + eos)
+    return prompts
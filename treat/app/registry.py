@@ -0,0 +1,137 @@
+import threading
+import logging
+import time
+
+from app import config
+from app import metrics
+from app.backends import load_backend
+
+class ModelHandle:
+    # Everything needed to run inference with one loaded model
+    def __init__(self, model_name, tokenizer, model, device, backend="torch-fp32"):
+        self.model_name = model_name
+        self.tokenizer = tokenizer
+        self.model = model
+        self.device = device
+        self.backend = backend
+
+    @property
+    def model_id(self):
+        # Identifies the weights and the numerics, e.g. for cache keys
+        return f"{self.model_name}@{self.backend}"
+
+    def __repr__(self):
+        return f"ModelHandle({self.model_name!r}, backend={self.backend!r}, device={self.device!r})"
+
+def load_model(model_name, backend):
+    # Load the tokenizer and model weights for the given model name and backend
+    start = time.perf_counter()
+    logging.info(f"Loading {model_name} with the {backend} backend")
+    with metrics.timed("model_load"):
+        tokenizer, model, device = load_backend(model_name, backend)
+    logging.info(f"Model loaded successfully on {device} in {time.perf_counter() - start:.2f}s")
+    return ModelHandle(model_name, tokenizer, model, device, backend)
+
+def warm_up(handle):
+    # Run one short inference so lazy kernels and allocator pools are initialised
+    import torch
+    if handle.model is None:
+        # Stand-in handles (see app.fakes) have nothing to warm up
+        return
+    start = time.perf_counter()
+    inputs = handle.tokenizer("Answer with YES or NO: is this a warm-up?", return_tensors="pt")
+    inputs = {k: v.to(handle.device) for k, v in inputs.items()}
+    with torch.no_grad():
+        handle.model.generate(**inputs, max_new_tokens=2)
+    logging.info(f"Warm-up inference for {handle.model_name} took {time.perf_counter() - start:.2f}s")
+
+class ModelRegistry:
+    # Process-wide cache of loaded models, so each model is loaded at most once
+    def __init__(self, loader=load_model):
+        self._loader = loader
+        self._handles = {}
+        self._lock = threading.Lock()
+        self._loading = set()
+        self._errors = {}
+
+    def get(self, model_name=None, backend=None, warm=None):
+        # Return the handle for model_name and backend, loading it on first use
+        # (and warming it up, unless warm is False or WARM_UP is off)
+        key = (model_name or config.MODEL_NAME, backend or config.BACKEND)
+        handle = self._handles.get(key)
+        if handle is not None:
+            return handle
+
+        self._loading.add(key)
+        try:
+            with self._lock:
+                # Another thread may have finished loading while we waited for the lock
+                handle = self._handles.get(key)
+                if handle is None:
+                    handle = self._loader(*key)
+                    if config.WARM_UP if warm is None else warm:
+                        warm_up(handle)
+                    self._handles[key] = handle
+                    self._errors.pop(key, None)
+        except Exception as e:
+            self._errors[key] = str(e)
+            raise
+        finally:
+            self._loading.discard(key)
+        return handle
+
+    def load_in_background(self, model_name=None, backend=None):
+        # Load (and warm up) a model on a daemon thread so the app can serve
+        # requests meanwhile; returns the thread
+        key = (model_name or config.MODEL_NAME, backend or config.BACKEND)
+        # Count as loading straight away, so status() never reports "not loaded" in between
+        self._loading.add(key)
+
+        def load():
+            try:
+                self.get(model_name, backend)
+            except Exception:
+                logging.exception("Background model load failed")
+
+        thread = threading.Thread(target=load, name="treat-model-load", daemon=True)
+        thread.start()
+        return thread
+
+    def warm_up_in_background(self, model_name=None, backend=None):
+        # Warm up an already loaded model on a daemon thread, e.g. in a worker
+        # forked from a process that preloaded the weights
+        handle = self._handles.get((model_name or config.MODEL_NAME, backend or config.BACKEND))
+        if handle is None or not config.WARM_UP:
+            return None
+        thread = threading.Thread(target=warm_up, args=(handle,), name="treat-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self, model_name=None, backend=None):
+        # "ready", "loading", "failed" or "not loaded", plus the error if it failed
+        key = (model_name or config.MODEL_NAME, backend or config.BACKEND)
+        if key in self._handles:
+            return "ready", None
+        if key in self._loading:
+            return "loading", None
+        if key in self._errors:
+            return "failed", self._errors[key]
+        return "not loaded", None
+
+    def register(self, handle):
+        # Install an already-loaded handle, e.g. a small local stand-in model
+        with self._lock:
+            self._handles[(handle.model_name, handle.backend)] = handle
+
+    def is_loaded(self, model_name=None, backend=None):
+        return (model_name or config.MODEL_NAME, backend or config.BACKEND) in self._handles
+
+    def unload(self, model_name=None, backend=None):
+        with self._lock:
+            self._handles.pop((model_name or config.MODEL_NAME, backend or config.BACKEND), None)
+
+# Shared registry used by the web app
+registry = ModelRegistry()
+
+def get_model(model_name=None, backend=None):
+    return registry.get(model_name, backend)
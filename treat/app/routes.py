@@ -1,6 +1,30 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context, g
+import json
+import time
+import zlib
 from app import app
-from app.model import analyze_script
+from app import config
+from app import metrics
+from app.registry import registry
+from app.memory import memory_report
+from app.model import analyze_script, get_scheduler, run_analysis_stream
+from app.ingest import upload_pieces, UploadTooLarge
+from app.jobs import job_manager, QueueFull
+
+# Time every request for the latency histograms
+@app.before_request
+def start_timer():
+    g.start = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    if request.url_rule is not None and "start" in g:
+        metrics.observe("request_seconds", time.perf_counter() - g.start, route=request.url_rule.rule, method=request.method)
+    return response
+
+def valid_document_id(document_id):
+    # Document ids are optional, but must be non-empty strings when given
+    return document_id is None or (isinstance(document_id, str) and document_id != "")
 
 # Define the home route which renders the index.html template
 @app.route('/')
@@ -11,14 +35,142 @@ def home():
 @app.route('/upload', methods=['POST'])
 def upload_script():
     try:
+        metrics.count("requests")
         # Get the JSON data from the request
         data = request.get_json()
         # Extract the text content from the JSON data
         content = data.get('text', '')
-        # Analyze the script for triggers
-        triggers = analyze_script(content)
+        if not valid_document_id(data.get('document_id')):
+            return jsonify({"error": "document_id must be a non-empty string"}), 400
+        # Analyze the script for triggers, reusing a previous revision's verdicts if it has a document id
+        triggers = analyze_script(content, document_id=data.get('document_id'))
         # Return the triggers in a JSON response
         return jsonify({"triggers": triggers})
     except Exception as e:
         # Handle any exceptions and return an error message
         return jsonify({"error": str(e)}), 500
+
+# Analyze a script streamed as the raw request body (text/plain), or as the
+# first file of a multipart/form-data upload, optionally gzipped; analysis
+# starts on the first chunks while the rest is still arriving
+@app.route('/upload/stream', methods=['POST'])
+def upload_stream():
+    metrics.count("requests")
+    if request.content_length is not None and request.content_length > config.MAX_UPLOAD_BYTES:
+        return jsonify({"error": f"Upload is larger than {config.MAX_UPLOAD_BYTES} bytes"}), 413
+
+    try:
+        pieces = upload_pieces(
+            request.stream,
+            request.mimetype,
+            request.mimetype_params,
+            request.headers.get('Content-Encoding', '').lower(),
+            config.MAX_UPLOAD_BYTES,
+            config.MAX_SCRIPT_CHARS
+        )
+        analysis = run_analysis_stream(pieces)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except (ValueError, zlib.error) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        metrics.count("errors")
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"triggers": analysis["final_triggers"] or ["None"], "chunks": analysis["chunks"]})
+
+# Start a background analysis job and return its id straight away
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    data = request.get_json(silent=True) or {}
+    content = data.get('text', '')
+    metrics.count("requests")
+    if not isinstance(content, str) or not content:
+        return jsonify({"error": "text must be a non-empty string"}), 400
+    if not valid_document_id(data.get('document_id')):
+        return jsonify({"error": "document_id must be a non-empty string"}), 400
+    try:
+        job = job_manager.submit(content, data.get('document_id'))
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429
+    return jsonify(job.to_dict()), 202
+
+# Report a job's status, progress and partial per-category scores
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+# Cancel a queued or running job
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+# Stream a job's per-chunk results as Server-Sent Events
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def stream():
+        seen = 0
+        while True:
+            events = job.wait_for_events(seen, timeout=15)
+            if not events:
+                # Keep the connection open through proxies while the job is idle
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                seen += 1
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+                if event['event'] in ("done", "failed", "cancelled"):
+                    return
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={"Cache-Control": "no-cache"})
+
+# Report the shared inference scheduler's queue length and batch sizes
+@app.route('/scheduler', methods=['GET'])
+def scheduler_stats():
+    return jsonify(get_scheduler().stats())
+
+# Counters, stage timers and latency histograms in the Prometheus text format
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Switch per-chunk debug logging on or off without a restart
+@app.route('/chunk-logging', methods=['GET', 'PUT'])
+def chunk_logging():
+    if request.method == 'PUT':
+        data = request.get_json(silent=True) or {}
+        metrics.set_chunk_logging(bool(data.get('enabled')))
+    return jsonify({"enabled": metrics.chunk_logging_enabled()})
+
+# Liveness: the process is up and serving requests
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({"status": "ok"})
+
+# Readiness: the model is loaded. The first probe starts loading it in the
+# background when it would otherwise wait for the first request.
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    status, error = registry.status()
+    if status == "not loaded":
+        registry.load_in_background()
+        status = "loading"
+    body = {"status": status, "model": config.MODEL_NAME, "backend": config.BACKEND}
+    if error:
+        body["error"] = error
+    return jsonify(body), 200 if status == "ready" else 503
+
+# RSS and PSS of this process and its inference workers; ?scope=siblings
+# reports every worker of a pre-fork server instead
+@app.route('/memory', methods=['GET'])
+def memory():
+    return jsonify(memory_report(siblings=request.args.get('scope') == 'siblings'))
@@ -0,0 +1,125 @@
+from collections import Counter, deque
+from concurrent.futures import Future
+import logging
+import threading
+import time
+
+class _WorkRequest:
+    # One (chunk, category) pair waiting for a verdict
+    __slots__ = ("handle", "chunk", "category", "decoding", "engine", "future")
+
+    def __init__(self, handle, chunk, category, decoding, engine):
+        self.handle = handle
+        self.chunk = chunk
+        self.category = category
+        self.decoding = decoding
+        self.engine = engine
+        self.future = Future()
+
+    @property
+    def group(self):
+        # Only requests for the same model and settings can share a batch
+        return (id(self.handle), self.decoding, self.engine)
+
+class InferenceScheduler:
+    # Collects (chunk, category) work from every in-flight analysis and runs it
+    # in shared batches on one dispatcher thread. A batch goes out as soon as
+    # it is full, or max_wait_ms after its first item arrived.
+    def __init__(self, classify, max_batch_size=64, max_wait_ms=5):
+        self._classify = classify
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = deque()
+        self._changed = threading.Condition()
+        self._thread = None
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes = Counter()
+
+    def _ensure_started(self):
+        # Start the dispatcher thread on first use (lock held by caller)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="treat-scheduler", daemon=True)
+            self._thread.start()
+
+    def submit(self, handle, chunks, work_items, decoding, engine):
+        # Queue (chunk index, category) work items; returns one future per item
+        requests = [_WorkRequest(handle, chunks[chunk_idx], category, decoding, engine) for chunk_idx, category in work_items]
+        with self._changed:
+            self._ensure_started()
+            self._queue.extend(requests)
+            self._changed.notify_all()
+        return [request.future for request in requests]
+
+    def classify(self, handle, chunks, work_items, decoding, engine):
+        # Same contract as model.classify, but batched with everyone else's work
+        return [future.result() for future in self.submit(handle, chunks, work_items, decoding, engine)]
+
+    def queue_length(self):
+        with self._changed:
+            return len(self._queue)
+
+    def stats(self):
+        with self._changed:
+            return {
+                "queue_length": len(self._queue),
+                "batches": self.batches,
+                "items": self.items,
+                "batch_size_histogram": dict(sorted(self.batch_sizes.items()))
+            }
+
+    def _next_batch(self):
+        # Wait for work, give the batch up to max_wait to fill, then take the
+        # oldest request plus as many others from its group as fit
+        with self._changed:
+            while not self._queue:
+                self._changed.wait()
+
+            deadline = time.monotonic() + self.max_wait
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+
+            group = self._queue[0].group
+            batch = []
+            remaining_queue = deque()
+            while self._queue:
+                request = self._queue.popleft()
+                if len(batch) < self.max_batch_size and request.group == group:
+                    batch.append(request)
+                else:
+                    remaining_queue.append(request)
+            self._queue = remaining_queue
+
+            self.batches += 1
+            self.items += len(batch)
+            self.batch_sizes[len(batch)] += 1
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            first = batch[0]
+
+            # Identical chunks from different requests are only sent once
+            chunks = []
+            chunk_index = {}
+            work_items = []
+            for request in batch:
+                if request.chunk not in chunk_index:
+                    chunk_index[request.chunk] = len(chunks)
+                    chunks.append(request.chunk)
+                work_items.append((chunk_index[request.chunk], request.category))
+
+            try:
+                verdicts = self._classify(first.handle, chunks, work_items, "batched", first.decoding, first.engine)
+            except Exception as e:
+                logging.exception("Scheduled inference batch failed")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            for request, verdict in zip(batch, verdicts):
+                request.future.set_result(verdict)
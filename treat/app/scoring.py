@@ -0,0 +1,108 @@
+from app import metrics
+from app.inference import plan_batches, MAX_INPUT_LENGTH
+
+# The only answers the analysis understands
+LABELS = ("YES", "NO", "MAYBE")
+
+# Spellings the model may use for each answer; the first sub-word token of
+# each one counts towards the label
+LABEL_VARIANTS = {
+    "YES": ("YES", "Yes", "yes"),
+    "NO": ("NO", "No", "no"),
+    "MAYBE": ("MAYBE", "Maybe", "maybe")
+}
+
+# Label token ids per tokenizer, computed once
+_label_token_cache = {}
+
+def label_token_ids(tokenizer):
+    # Map each label to the first-token ids of its spellings. A token id that is
+    # shared by two labels would make them indistinguishable, so it is only
+    # kept for the first label that uses it.
+    key = id(tokenizer)
+    if key in _label_token_cache:
+        return _label_token_cache[key]
+
+    seen = set()
+    token_ids = {}
+    for label in LABELS:
+        ids = []
+        for variant in LABEL_VARIANTS[label]:
+            variant_ids = tokenizer(variant, add_special_tokens=False)["input_ids"]
+            if variant_ids and variant_ids[0] not in seen:
+                seen.add(variant_ids[0])
+                ids.append(variant_ids[0])
+        if not ids:
+            raise ValueError(f"Tokenizer has no usable token for label {label}")
+        token_ids[label] = ids
+
+    _label_token_cache[key] = token_ids
+    return token_ids
+
+def label_probabilities(logits, token_ids):
+    # Collapse first-step decoder logits (batch x vocab) into a YES/NO/MAYBE
+    # distribution per row, ignoring every other token in the vocabulary
+    import torch
+    label_logits = torch.stack(
+        [torch.logsumexp(logits[:, token_ids[label]].float(), dim=-1) for label in LABELS],
+        dim=-1
+    )
+    return torch.softmax(label_logits, dim=-1)
+
+def to_verdict(probs):
+    # Turn a {label: probability} dict into a verdict with the most likely label
+    return {"label": max(LABELS, key=lambda label: probs[label]), "probs": probs}
+
+# Share of a uniform distribution mixed into each calibration prior, so a
+# label the prompt rarely produces on content-free text is not blown up
+PRIOR_SMOOTHING = 0.5
+
+def calibrate(probs, prior):
+    # Contextual calibration: divide out the label bias the prompt shows on
+    # content-free input (smoothed towards uniform), then renormalise
+    uniform = 1 / len(LABELS)
+    adjusted = {
+        label: probs[label] / ((1 - PRIOR_SMOOTHING) * prior[label] + PRIOR_SMOOTHING * uniform)
+        for label in LABELS
+    }
+    total = sum(adjusted.values())
+    return {label: adjusted[label] / total for label in LABELS}
+
+def score_prompts(handle, prompts, batch_size=16, max_batch_tokens=8192):
+    # One encoder pass and one decoder step per prompt. Returns a
+    # {label: probability} dict for every prompt, in order.
+    with metrics.timed("tokenize"):
+        encoded = handle.tokenizer(prompts, truncation=True, max_length=MAX_INPUT_LENGTH)["input_ids"]
+    return score_encoded(handle, encoded, batch_size, max_batch_tokens)
+
+def score_encoded(handle, encoded, batch_size=16, max_batch_tokens=8192):
+    # score_prompts() for prompts that are already input ids
+    import torch
+    tokenizer, model = handle.tokenizer, handle.model
+    token_ids = label_token_ids(tokenizer)
+    metrics.count("tokens", sum(len(ids) for ids in encoded))
+    batches = plan_batches([len(ids) for ids in encoded], batch_size, max_batch_tokens)
+    metrics.chunk_log.debug(f"Scoring {len(encoded)} prompts in {len(batches)} batches")
+
+    results = [None] * len(encoded)
+    for batch in batches:
+        with metrics.timed("tokenize"):
+            inputs = tokenizer.pad({"input_ids": [encoded[i] for i in batch]}, return_tensors="pt")
+            inputs = {k: v.to(handle.device) for k, v in inputs.items()}
+        decoder_input_ids = torch.full(
+            (len(batch), 1),
+            model.config.decoder_start_token_id,
+            dtype=torch.long,
+            device=handle.device
+        )
+
+        with torch.no_grad(), metrics.timed("generate"):
+            logits = model(**inputs, decoder_input_ids=decoder_input_ids).logits[:, -1, :]
+        metrics.count("model_calls")
+
+        with metrics.timed("decode"):
+            probs = label_probabilities(logits, token_ids).tolist()
+            for idx, row in zip(batch, probs):
+                results[idx] = dict(zip(LABELS, row))
+
+    return results
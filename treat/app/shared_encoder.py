@@ -0,0 +1,88 @@
+from app import metrics
+from app.inference import MAX_INPUT_LENGTH
+from app.scoring import LABELS, label_token_ids, label_probabilities
+
+# The encoder only ever sees the chunk, so it can be shared by every category
+ENCODER_TEMPLATE = 'Text to analyze:\n"{chunk}"'
+
+# The category question goes on the decoder side, right before the answer
+DECODER_TEMPLATE = (
+    "Task: Decide whether the text contains content related to {mapped_name}. "
+    "Context: {description} "
+    "Important: Consider both explicit and implicit references. "
+    "Answer with ONLY ONE of these exact words: YES, NO, or MAYBE. Answer:"
+)
+
+# Decoder prefixes per (tokenizer, category), tokenized once
+_decoder_prefix_cache = {}
+
+def decoder_prefixes(handle, categories):
+    # Decoder input ids for each category: start token followed by the question
+    tokenizer = handle.tokenizer
+    start_id = handle.model.config.decoder_start_token_id
+    prefixes = []
+    for category, info in categories.items():
+        key = (id(tokenizer), category, info["mapped_name"], info["description"])
+        if key not in _decoder_prefix_cache:
+            text = DECODER_TEMPLATE.format(mapped_name=info["mapped_name"], description=info["description"])
+            _decoder_prefix_cache[key] = [start_id] + tokenizer(text, add_special_tokens=False)["input_ids"]
+        prefixes.append(_decoder_prefix_cache[key])
+    return prefixes
+
+def score_chunks(handle, chunks, categories, chunks_per_batch=4):
+    # Encode each chunk once and evaluate every category against the cached
+    # encoder output. Returns one {label: probability} dict per
+    # (chunk, category) pair, chunk-major in the order of `categories`.
+    import torch
+    tokenizer, model = handle.tokenizer, handle.model
+    token_ids = label_token_ids(tokenizer)
+    prefixes = decoder_prefixes(handle, categories)
+    num_categories = len(prefixes)
+
+    # Right-padded decoder inputs shared by every chunk
+    prefix_lengths = torch.tensor([len(ids) for ids in prefixes], device=handle.device)
+    longest = int(prefix_lengths.max())
+    decoder_input_ids = torch.full((num_categories, longest), tokenizer.pad_token_id, dtype=torch.long, device=handle.device)
+    for row, ids in enumerate(prefixes):
+        decoder_input_ids[row, :len(ids)] = torch.tensor(ids, device=handle.device)
+    decoder_attention_mask = (torch.arange(longest, device=handle.device)[None, :] < prefix_lengths[:, None]).long()
+
+    results = []
+    for start in range(0, len(chunks), chunks_per_batch):
+        batch = chunks[start:start + chunks_per_batch]
+        with metrics.timed("tokenize"):
+            inputs = tokenizer(
+                [ENCODER_TEMPLATE.format(chunk=chunk) for chunk in batch],
+                return_tensors="pt",
+                padding=True,
+                truncation=True,
+                max_length=MAX_INPUT_LENGTH
+            )
+            inputs = {k: v.to(handle.device) for k, v in inputs.items()}
+        metrics.count("tokens", int(inputs["attention_mask"].sum()))
+
+        with torch.no_grad(), metrics.timed("generate"):
+            # One encoder pass per chunk...
+            encoder_hidden = model.get_encoder()(**inputs).last_hidden_state
+
+            # ...reused by every category: repeat each chunk's states once per category
+            rows = len(batch) * num_categories
+            encoder_hidden = encoder_hidden.repeat_interleave(num_categories, dim=0)
+            attention_mask = inputs["attention_mask"].repeat_interleave(num_categories, dim=0)
+            logits = model(
+                encoder_outputs=(encoder_hidden,),
+                attention_mask=attention_mask,
+                decoder_input_ids=decoder_input_ids.repeat(len(batch), 1),
+                decoder_attention_mask=decoder_attention_mask.repeat(len(batch), 1)
+            ).logits
+        metrics.count("model_calls")
+
+        # Read the answer logits right after each row's last real decoder token
+        with metrics.timed("decode"):
+            last_positions = (prefix_lengths - 1).repeat(len(batch))
+            logits = logits[torch.arange(rows, device=handle.device), last_positions]
+            for row in label_probabilities(logits, token_ids).tolist():
+                results.append(dict(zip(LABELS, row)))
+
+    metrics.chunk_log.debug(f"Scored {len(chunks)} chunks x {num_categories} categories with {len(chunks)} encoder passes")
+    return results
@@ -0,0 +1,12 @@
+import os
+import sys
+from os.path import dirname, abspath
+
+# Add the directory of the 'treat' folder to the system path
+sys.path.append(abspath(dirname(__file__)) + "/treat")
+
+# Load the model weights while the app is imported, so a pre-fork server that
+# imports it once (gunicorn --preload) shares them with all its workers
+os.environ.setdefault("TREAT_LOAD_MODEL", "preload")
+
+from app import app as application